@@ -10,14 +10,22 @@ Description:
 """
 
 #Import Required Modules-------------------------------
-from multiprocessing import Pool, cpu_count
-
+import sys
+#import crandom as random
+import random
+from multiprocessing import Pipe, get_all_start_methods, get_context
 from xcs_class_accuracy import ClassAccuracy
 from xcs_classifierset import ClassifierSet
 from xcs_constants import *
+from xcs_matching import SerialMatcher
 from xcs_outputfile_manager import OutputFileManager
 from xcs_prediction import *
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
+MAX_CHECKPOINT_WORKERS = 2      # Background checkpoint evaluations running at the same time
 
 #------------------------------------------------------
 class XCS:
@@ -27,14 +35,13 @@ class XCS:
         #Global Parameters-------------------------------------------------------------------------------------
         self.population = None          # The rule population (the 'solution/model' evolved by XCS)
         self.learn_track = None       # Output file that will store tracking information during learning
-        self.pool = None
+        self.checkpoint_workers = []    # Background checkpoint evaluations not collected yet, oldest first, as (result connection, process) pairs
+        self.checkpoint_eval = None     # Evaluation of the last collected background checkpoint
         self.kfold_set = kfold_i
         if kfold_i != '':
             self.prefix_out_file = cons.out_file+'_'+self.kfold_set
         else:
             self.prefix_out_file = cons.out_file
-        if cons.multiprocessing:
-            self.pool = Pool( processes=cpu_count() )
         #-------------------------------------------------------
         # POPULATION REBOOT - Begin XCS learning from an existing saved rule population
         #-------------------------------------------------------
@@ -112,46 +119,17 @@ class XCS:
             # CHECKPOINT - COMPLETE EVALUTATION OF POPULATION - strategy different for discrete vs continuous phenotypes
             #-------------------------------------------------------
             if self.iteration in cons.iter_checkpoints:
-                cons.timer.startTimeEvaluation()
-                print("------------------------------------------------------------------------------------------------------------------------------------------------------")
-                print("Running Population Evaluation after " + str(self.iteration)+ " iterations.")
-
-                self.population.runPopAveEval()
-                self.population.runAttGeneralitySum(True)
-                cons.env.startEvaluationMode()  #Preserves learning position in training data
-                if cons.test_file != 'None' or not cons.online_data_generator: #If a testing file is available.
-                    if cons.env.format_data.discrete_action:
-                        train_eval = self.doPopEvaluation(True)
-                        ret_eval = test_eval = self.doPopEvaluation(False)
-                    else:
-                        train_eval = self.doContPopEvaluation(True)
-                        ret_eval = test_eval = self.doContPopEvaluation(False)
-                else:  #Only a training file is available
-                    if cons.env.format_data.discrete_action:
-                        ret_eval = train_eval = self.doPopEvaluation(True)
-                        test_eval = None
-                    else:
-                        ret_eval = train_eval = self.doContPopEvaluation(True)
-                        test_eval = None
-
-                cons.env.stopEvaluationMode() #Returns to learning position in training data
-                cons.timer.stopTimeEvaluation()
-                cons.timer.returnGlobalTimer()
-
-                #Write output files----------------------------------------------------------------------------------------------------------
-                OutputFileManager().writePopStats(self.prefix_out_file, train_eval, test_eval, self.iteration, self.population, self.tracked_results)
-                OutputFileManager().writePop(self.prefix_out_file, self.iteration, self.population)
-                #----------------------------------------------------------------------------------------------------------------------------
-
-                print("Continue Learning...")
-                print("------------------------------------------------------------------------------------------------------------------------------------------------------")
+                if cons.background_evaluation and 'fork' in get_all_start_methods():
+                    self.startBackgroundCheckpoint()
+                else:
+                    ret_eval = self.runCheckpoint()
             # Switch between explore and exploit
             if cons.exploration == 0.5:
                 explorer = 1 - explorer
-        if cons.multiprocessing:
-            self.pool.close()
         # Once XCS has reached the last learning iteration, close the tracking file
         self.learn_track.close()
+        if self.checkpoint_workers or self.checkpoint_eval != None:
+            ret_eval = self.collectCheckpoints()
         print("XCS Run Complete")
         print("Compacting...")
         self.population.finalise()
@@ -173,9 +151,88 @@ class XCS:
             ret_eval += train_eval
         OutputFileManager().writePopStats(self.prefix_out_file+'_finalised', train_eval, test_eval, self.iteration, self.population, self.tracked_results)
         OutputFileManager().writePop(self.prefix_out_file+'_finalised', self.iteration, self.population)
+        self.population.matcher.close()
+        return ret_eval
+
+
+    def runCheckpoint(self):
+        """ Runs a complete evaluation of the population and writes the output files of the current checkpoint. Returns the evaluation of the checkpoint. """
+        cons.timer.startTimeEvaluation()
+        print("------------------------------------------------------------------------------------------------------------------------------------------------------")
+        print("Running Population Evaluation after " + str(self.iteration)+ " iterations.")
+
+        self.population.runPopAveEval()
+        self.population.runAttGeneralitySum(True)
+        cons.env.startEvaluationMode()  #Preserves learning position in training data
+        if cons.test_file != 'None' or not cons.online_data_generator: #If a testing file is available.
+            if cons.env.format_data.discrete_action:
+                train_eval = self.doPopEvaluation(True)
+                ret_eval = test_eval = self.doPopEvaluation(False)
+            else:
+                train_eval = self.doContPopEvaluation(True)
+                ret_eval = test_eval = self.doContPopEvaluation(False)
+        else:  #Only a training file is available
+            if cons.env.format_data.discrete_action:
+                ret_eval = train_eval = self.doPopEvaluation(True)
+                test_eval = None
+            else:
+                ret_eval = train_eval = self.doContPopEvaluation(True)
+                test_eval = None
+
+        cons.env.stopEvaluationMode() #Returns to learning position in training data
+        cons.timer.stopTimeEvaluation()
+        cons.timer.returnGlobalTimer()
+
+        #Write output files----------------------------------------------------------------------------------------------------------
+        OutputFileManager().writePopStats(self.prefix_out_file, train_eval, test_eval, self.iteration, self.population, self.tracked_results)
+        OutputFileManager().writePop(self.prefix_out_file, self.iteration, self.population)
+        #----------------------------------------------------------------------------------------------------------------------------
+
+        print("Continue Learning...")
+        print("------------------------------------------------------------------------------------------------------------------------------------------------------")
         return ret_eval
 
 
+    def startBackgroundCheckpoint(self):
+        """ Forks a process that runs the checkpoint evaluation on a copy-on-write snapshot of the population, while learning continues here.
+        Finished checkpoints are collected first, and at most MAX_CHECKPOINT_WORKERS run at once: past that, the oldest one is waited for. """
+        while self.checkpoint_workers and self.checkpoint_workers[0][0].poll():
+            self.collectOldestCheckpoint()
+        while len( self.checkpoint_workers ) >= MAX_CHECKPOINT_WORKERS:
+            self.collectOldestCheckpoint()
+        sys.stdout.flush()  # Pending output would otherwise be written again by the forked process
+        receiver, sender = Pipe( False )
+        worker = get_context( 'fork' ).Process( target=self.runBackgroundCheckpoint, args=( sender, random.getstate() ) )
+        worker.start()
+        sender.close()
+        self.checkpoint_workers.append( ( receiver, worker ) )
+
+    def runBackgroundCheckpoint(self, conn, random_state):
+        """ Runs the checkpoint in the forked process and sends its evaluation back. The random generator, reseeded by the fork, is set back to
+        the state of the learning process, so evaluation instances and tie-breaks are drawn as in an inline checkpoint. """
+        random.setstate( random_state )
+        if cons.multiprocessing:    # The matching workers belong to the learning process
+            self.population.matcher = SerialMatcher( self.population )
+        conn.send( self.runCheckpoint() )
+        conn.close()
+
+    def collectOldestCheckpoint(self):
+        """ Waits for the oldest background checkpoint, keeps its evaluation and reaps its process. """
+        receiver, worker = self.checkpoint_workers.pop( 0 )
+        try:
+            self.checkpoint_eval = receiver.recv()
+        except EOFError:
+            self.checkpoint_eval = None
+            print("XCS: Error - background checkpoint evaluation failed (exit code "+str(worker.exitcode)+").")
+        receiver.close()
+        worker.join()
+
+    def collectCheckpoints(self):
+        """ Waits for the background checkpoints and returns the evaluation of the last one. """
+        while self.checkpoint_workers:
+            self.collectOldestCheckpoint()
+        return self.checkpoint_eval
+
     def runExploit(self, state_action):
         """ Run an exploit iteration. """
         self.population.makeMatchSet( state_action[0], self.iteration )
@@ -199,7 +256,7 @@ class XCS:
         #-----------------------------------------------------------------------------------------------------------------------------------------
         # FORM A MATCH SET - includes covering
         #-----------------------------------------------------------------------------------------------------------------------------------------
-        self.population.makeMatchSet( state_action[0], self.iteration, self.pool )
+        self.population.makeMatchSet( state_action[0], self.iteration )
         #-----------------------------------------------------------------------------------------------------------------------------------------
         # MAKE A PREDICTION - utilized here for tracking estimated learning progress.  Typically used in the explore phase of many LCS algorithms.
         #-----------------------------------------------------------------------------------------------------------------------------------------
@@ -255,33 +312,50 @@ class XCS:
         for each in phenotype_list:
             class_accuracies[each] = ClassAccuracy()
         #----------------------------------------------------------------------------------------------
-        for _ in range(instances):
-            if is_train:
-                state_action = cons.env.getTrainInstance()
-            else:
-                state_action = cons.env.getTestInstance()
+        #Without NumPy, or when every instance is generated on the fly, instances are evaluated one at a time. Otherwise they are fetched and
+        #predicted in chunks; the last instance is always fetched on its own, after all other decisions, as the environment reshuffles the
+        #training data when it is fetched and ties in the decisions draw from the same random generator.
+        if np != None and not cons.online_data_generator:
+            batch_prediction = BatchPrediction( self.population )
+            chunk_size = batch_prediction.chunk_size
+        else:
+            batch_prediction = None
+            chunk_size = 1
+        evaluated = 0
+        while evaluated < instances:
+            state_actions = []
+            for _ in range( max( 1, min( chunk_size, instances - 1 - evaluated ) ) ):
+                if is_train:
+                    state_actions.append( cons.env.getTrainInstance() )
+                else:
+                    state_actions.append( cons.env.getTestInstance() )
+            evaluated += len( state_actions )
             #-----------------------------------------------------------------------------
-            self.population.makeEvalMatchSet( state_action[0] )
-            prediction = Prediction( self.population )
-            selected_action = prediction.decide( exploring=False )
+            if batch_prediction != None:
+                predictions = batch_prediction.predict( [ state_action[0] for state_action in state_actions ] )
+            else:
+                self.population.makeEvalMatchSet( state_actions[0][0] )
+                predictions = [ Prediction( self.population ) ]
+                self.population.clearSets()
             #-----------------------------------------------------------------------------
-
-            if selected_action == None:
-                no_match += 1
-            elif selected_action == 'Tie':
-                tie += 1
-            else: #Instances which failed to be covered are excluded from the accuracy calculation
-                for each in phenotype_list:
-                    is_correct = False
-                    accurate_action = False
-                    right_action = state_action[1]
-                    if each == right_action:
-                        is_correct = True
-                    if selected_action == right_action:
-                        accurate_action = True
-                    class_accuracies[each].updateAccuracy( is_correct, accurate_action )
-
-            self.population.clearSets()
+            for j in range( len(state_actions) ):
+                selected_action = predictions[j].decide( exploring=False )
+                #-----------------------------------------------------------------------------
+
+                if selected_action == None:
+                    no_match += 1
+                elif selected_action == 'Tie':
+                    tie += 1
+                else: #Instances which failed to be covered are excluded from the accuracy calculation
+                    for each in phenotype_list:
+                        is_correct = False
+                        accurate_action = False
+                        right_action = state_actions[j][1]
+                        if each == right_action:
+                            is_correct = True
+                        if selected_action == right_action:
+                            accurate_action = True
+                        class_accuracies[each].updateAccuracy( is_correct, accurate_action )
         #----------------------------------------------------------------------------------------------
         #Calculate Standard Accuracy--------------------------------------------
         correct_cases = class_accuracies[phenotype_list[0]].T_myClass + class_accuracies[phenotype_list[0]].T_otherClass
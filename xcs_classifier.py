@@ -15,15 +15,18 @@ XCS: Michigan-style Learning Classifier System - A LCS for Reinforcement Learnin
 from xcs_constants import *
 #import crandom as random
 import random
-#import math
+import math
 #--------------------------------------
 
 class Classifier:
-    def __init__(self,a=None,b=None,c=None):
+    def __init__(self,a=None,b=None,c=None,d=None):
         #Major Parameters --------------------------------------------------
         self.specified_attributes = []      # Attribute Specified in classifier: Similar to Bacardit 2009 - ALKR + GABIL, continuous and discrete rule representation
         self.condition = []                 # States of Attributes Specified in classifier: Similar to Bacardit 2009 - ALKR + GABIL, continuous and discrete rule representation
         self.action = None                  # Class if the endpoint is discrete, and a continuous phenotype if the endpoint is continuous
+        self.care_mask = 0                  # Bit i set if attribute i is specified (specified-attribute bitset)
+        self.value_mask = 0                 # Bit i set if attribute i is specified as 1 (packed condition, binary attributes only)
+        self.key = None                     # Hashable identity of the rule: action plus sorted (attribute, value) pairs, kept up to date by makeKey
 
         self.prediction = cons.init_pred    # Classifier payoff - initialized to a constant initial payoff value
         self.error = cons.init_err          # Classifier error - initialized to a constant initial error value
@@ -42,20 +45,22 @@ class Classifier:
         self.action_cnt = 0                 # The total number of times this classifier was chosen in action set
 
         if isinstance(b,list):
-            self.classifierCovering(a,b,c)
+            self.classifierCovering(a,b,c,d)
         elif isinstance(a,Classifier):
             self.classifierCopy(a)
         elif isinstance(a,list) and b == None:
             self.rebootClassifier(a)
         else:
             print("Classifier: Error building classifier.")
+        self.makeKey()
 
     #--------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
     # CLASSIFIER CONSTRUCTION METHODS
     #--------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
-    def classifierCovering(self, iteration, state, action):
+    def classifierCovering(self, iteration, state, action, attributes=None):
         """ Makes a new classifier when the covering mechanism is triggered.  The new classifier will match the current training instance.
-        Covering will NOT produce a default rule (i.e. a rule with a completely general condition). """
+        Covering will NOT produce a default rule (i.e. a rule with a completely general condition). The attributes to specify can be drawn
+        beforehand for several rules at once (see coveringAttributes). """
         #Initialize new classifier parameters----------
         self.ga_timestamp = iteration
         self.init_timestamp = iteration
@@ -66,8 +71,10 @@ class Classifier:
         #-------------------------------------------------------
         # GENERATE MATCHING CONDITION
         #-------------------------------------------------------
-        for att in range( cons.env.format_data.numb_attributes ):
-            if random.random() < cons.p_spec and state[att] != cons.missing_label:
+        if attributes == None:
+            attributes = randomPositions( cons.env.format_data.numb_attributes, cons.p_spec )
+        for att in attributes:
+            if state[att] != cons.missing_label:
                 self.specified_attributes.append( att )
                 self.condition.append( state[att] )
 
@@ -134,6 +141,19 @@ class Classifier:
         return True
 
 
+    def packCondition(self):
+        """ Packs the specified attributes into a care mask, used for generality tests. When all attributes are binary the values are also packed into
+        a value mask, so that the classifier can be matched or compared with a single XOR/AND. """
+        self.care_mask = 0
+        self.value_mask = 0
+        binary = cons.env.format_data.binary_attributes
+        for i in range(len(self.condition)):
+            bit = 1 << self.specified_attributes[i]
+            self.care_mask |= bit
+            if binary and int(self.condition[i]) == 1:
+                self.value_mask |= bit
+
+
     #--------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
     # GENETIC ALGORITHM MECHANISMS
     #--------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
@@ -186,6 +206,8 @@ class Classifier:
             self.action = cl.action
             cl.action = temp
             changed = True
+        self.makeKey()
+        cl.makeKey()
         return changed
 
 
@@ -215,6 +237,9 @@ class Classifier:
                 self.specified_attributes.append(i)
                 cl.specified_attributes.remove(i)
                 changed = True
+        if changed:
+            self.makeKey()
+            cl.makeKey()
         return changed
 
 
@@ -235,6 +260,9 @@ class Classifier:
                 self.action[1] = cl.action[1]
                 cl.action[1] = temp
                 changed = True
+            if changed:
+                self.makeKey()
+                cl.makeKey()
 
         return changed
 
@@ -245,8 +273,8 @@ class Classifier:
         #-------------------------------------------------------
         # MUTATE CONDITION
         #-------------------------------------------------------
-        for att in range(cons.env.format_data.numb_attributes):  #Each condition specifies different attributes, so we need to go through all attributes in the dataset.
-            if random.random() < cons.mu and state[att] != cons.missing_label:
+        for att in randomPositions( cons.env.format_data.numb_attributes, cons.mu ):  #Attributes drawn for mutation, in increasing order.
+            if state[att] != cons.missing_label:
                 #MUTATION--------------------------------------------------------------------------------------------------------------
                 if att not in self.specified_attributes: #Attribute not yet specified
                     self.specified_attributes.append(att)
@@ -270,6 +298,8 @@ class Classifier:
             action_list.remove(self.action)
             self.action = random.choice(action_list)
             changed= True
+        if changed:
+            self.makeKey()
         return changed
 
 
@@ -281,6 +311,7 @@ class Classifier:
             action_list.remove(self.action)
             self.action = random.choice(action_list)
             changed= True
+            self.makeKey()
         return changed
 
 
@@ -316,9 +347,88 @@ class Classifier:
 
             #Repair range - such that min specified first, and max second.
             self.action.sort()
+            self.makeKey()
         #---------------------------------------------------------------------
         return changed
 
+    #--------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # GENETIC ALGORITHM MECHANISMS ON CARE MASKS - same operators with the per-attribute random draws replaced by random masks (cons.ga_operators = 'masks')
+    #--------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+    def maskUniformCrossover(self, cl):
+        """ Uniform crossover as a random-mask blend: each attribute specified in only one parent moves to the other with probability 0.5. """
+        self_care_mask = self.care_mask
+        moved = ( self.care_mask ^ cl.care_mask ) & random.getrandbits( cons.env.format_data.numb_attributes )
+        changed = moved != 0
+        self.exchangeAttributes( cl, moved )
+        if changed and self_care_mask == cl.care_mask:
+            changed = False
+        if self.action != cl.action and random.random() > 0.5:
+            # Switch phenotypes of 2 classifiers if GA is run in match set
+            temp = self.action
+            self.action = cl.action
+            cl.action = temp
+            changed = True
+        self.makeKey()
+        cl.makeKey()
+        return changed
+
+    def maskTwoPointCrossover(self, cl):
+        """ Two point crossover as a mask splice: attributes specified in only one parent move to the other between the two points. """
+        points = [None, None]
+        points[0] = int( random.random() * ( cons.env.format_data.numb_attributes ) )
+        points[1] = int( random.random() * ( cons.env.format_data.numb_attributes ) )
+        points.sort()
+        splice = ( 1 << ( points[1] + 1 ) ) - ( 1 << points[0] )
+        moved = ( self.care_mask ^ cl.care_mask ) & splice
+        if moved == 0:
+            return False
+        self.exchangeAttributes( cl, moved )
+        self.makeKey()
+        cl.makeKey()
+        return True
+
+    def maskMutation(self, state):
+        """ Niche mutation with a random flip mask over the attributes that are not missing in state, then the phenotype mutation of Mutation. """
+        changed = False
+        if cons.skip_sampling:
+            flips = sum( [ 1 << att for att in skipPositions( cons.env.format_data.numb_attributes, cons.mu ) ] ) & presentMask( state )
+        else:
+            flips = randomMask( cons.env.format_data.numb_attributes, cons.mu ) & presentMask( state )
+        if flips != 0:
+            values = dict( zip( self.specified_attributes, self.condition ) )
+            for att in maskBits( flips & ~self.care_mask ):     # Attribute not yet specified
+                values[att] = state[att]
+            for att in maskBits( flips & self.care_mask ):      # Attribute already specified
+                del values[att]
+            self.specified_attributes = list( values.keys() )
+            self.condition = list( values.values() )
+            changed = True
+        if random.random() < cons.mu:
+            action_list = cons.env.format_data.action_list[:]
+            action_list.remove(self.action)
+            self.action = random.choice(action_list)
+            changed = True
+        if changed:
+            self.makeKey()
+        return changed
+
+    def exchangeAttributes(self, cl, moved):
+        """ Moves the attributes in the moved mask, with their values, from whichever of self and cl specifies them to the other. Moved attributes are
+        appended in attribute order, as the list-based operators do. """
+        self_values = dict( zip( self.specified_attributes, self.condition ) )
+        cl_values = dict( zip( cl.specified_attributes, cl.condition ) )
+        for att in maskBits( moved ):
+            if att in self_values:
+                cl_values[att] = self_values.pop( att )
+            else:
+                self_values[att] = cl_values.pop( att )
+        self.specified_attributes = list( self_values.keys() )
+        self.condition = list( self_values.values() )
+        cl.specified_attributes = list( cl_values.keys() )
+        cl.condition = list( cl_values.values() )
+        self.care_mask ^= moved
+        cl.care_mask ^= moved
+
     #--------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
     # SUBSUMPTION METHODS
     #--------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
@@ -338,23 +448,19 @@ class Classifier:
         """ Returns if the classifier (self) is more general than cl. Check that all attributes specified in self are also specified in cl. """
         if len(self.specified_attributes) >= len(cl.specified_attributes):# and self.action != cl.action and self.prediction < cl.prediction and self.error > cl.error:
             return False
-        for i in range(len(self.specified_attributes)): #Check each attribute specified in self.condition
-            if self.specified_attributes[i] not in cl.specified_attributes:
-                return False
-        return True
+        return self.care_mask & ~cl.care_mask == 0   #Attributes specified in self are a subset of those specified in cl
 
     def compactSubsumes(self, cl):
         """ Returns whether the classifier (self) subsumes cl (in compacting). """
         if len(self.specified_attributes) > len(cl.specified_attributes):# and self.action != cl.action and self.prediction < cl.prediction and self.error > cl.error:
             return False
-        if cl.action == self.action:
+        if cl.action == self.action and self.care_mask & ~cl.care_mask == 0:
+            if cons.env.format_data.binary_attributes:
+                return not ( self.value_mask ^ cl.value_mask ) & self.care_mask
+            cl_values = dict( zip( cl.specified_attributes, cl.condition ) )
             for i in range( len(self.specified_attributes) ):
-                if self.specified_attributes[i] not in cl.specified_attributes:
+                if self.condition[i] != cl_values[ self.specified_attributes[i] ]:
                     return False
-                else:
-                    j = cl.specified_attributes.index( self.specified_attributes[i] )
-                    if self.condition[i] != cl.condition[j]:
-                        return False
             return True
         return False
 
@@ -374,20 +480,27 @@ class Classifier:
     #--------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
     # OTHER METHODS
     #--------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+    def makeKey(self):
+        """ Rebuilds the hashable key identifying the rule from its action and its sorted (attribute, value) pairs, and the packed condition.
+        Must be called whenever the condition or action changes. """
+        if isinstance(self.action, list):   # continuous phenotype range
+            action = tuple(self.action)
+        else:
+            action = self.action
+        self.key = ( action, tuple( sorted( zip( self.specified_attributes, self.condition ) ) ) )
+        self.packCondition()
+
     def equals(self, cl, niched = True):
         """ Returns if the two classifiers are identical in condition and phenotype. This works for discrete or continuous attributes or phenotypes. """
-        if cl.action == self.action and len( cl.specified_attributes ) == len( self.specified_attributes ): #Is phenotype the same and are the same number of attributes specified - quick equality check first.
-            cl_atts = sorted(cl.specified_attributes)
-            self_atts = sorted(self.specified_attributes)
-            if cl_atts == self_atts:
-                if not niched:      # compare condition if comparison between classifiers in different niches.
-                    for i in range( len(cl.specified_attributes) ):
-                        tmp_index = self.specified_attributes.index( cl.specified_attributes[i] )
-                        if cl.condition[i] == self.condition[tmp_index]:
-                            pass
-                        else:
-                            return False
-                return True
+        if cl.action == self.action and cl.care_mask == self.care_mask: #Is phenotype the same and are the same attributes specified
+            if not niched:      # compare condition if comparison between classifiers in different niches.
+                for i in range( len(cl.specified_attributes) ):
+                    tmp_index = self.specified_attributes.index( cl.specified_attributes[i] )
+                    if cl.condition[i] == self.condition[tmp_index]:
+                        pass
+                    else:
+                        return False
+            return True
         return False
 
     def updateXCSParameters(self, reward):
@@ -477,3 +590,106 @@ class Classifier:
 
         #------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
         return classifier_info
+
+
+class Offspring( Classifier ):
+    def __init__(self, parent, iteration):
+        """ Candidate offspring of the GA, a copy of parent (see classifierCopy) holding only what the genetic operators, subsumption and the
+        identical-rule lookup use. The key and packed masks of the parent are reused until an operator changes the rule. Most candidates end up
+        subsumed or merged into an existing rule; the others become a full Classifier through materialize() when they enter the population. """
+        self.specified_attributes = parent.specified_attributes[:]
+        self.condition = parent.condition[:]
+        self.action = parent.action
+        self.care_mask = parent.care_mask
+        self.value_mask = parent.value_mask
+        self.key = parent.key
+        self.prediction = parent.prediction
+        self.error = parent.error
+        self.fitness = parent.fitness/parent.numerosity
+        self.numerosity = 1
+        self.avg_actionset_size = parent.avg_actionset_size
+        self.ga_timestamp = parent.ga_timestamp
+        self.init_timestamp = parent.ga_timestamp
+
+    def materialize(self):
+        """ Sets the remaining parameters of a new rule and turns the candidate into a Classifier. """
+        self.accuracy = 0.0
+        self.delete_vote = 0.0
+        self.ga_count = 0
+        self.action_cnt = 0
+        self.__class__ = Classifier
+
+
+def maskBits(mask):
+    """ Yields the positions of the set bits of mask, in increasing order. """
+    while mask:
+        low_bit = mask & -mask
+        yield low_bit.bit_length() - 1
+        mask ^= low_bit
+
+
+def presentMask(state):
+    """ Returns the mask of the attributes of state that are not missing. """
+    mask = ( 1 << len(state) ) - 1
+    att = -1
+    for i in range( state.count( cons.missing_label ) ):
+        att = state.index( cons.missing_label, att + 1 )
+        mask ^= 1 << att
+    return mask
+
+
+def randomMask(numb_bits, probability):
+    """ Returns a mask of numb_bits bits, each set independently with the probability that random.random() < probability. A uniform 53-bit number
+    is compared with probability bit by bit from the most significant bit, for all positions at once, until every position is decided, so the number of
+    random words drawn grows with the logarithm of numb_bits. """
+    threshold = math.ceil( probability * 2**53 )    # random.random() < probability exactly when its 53-bit integer is below threshold
+    if threshold <= 0 or numb_bits <= 0:
+        return 0
+    undecided = ( 1 << numb_bits ) - 1
+    if threshold >= 2**53:
+        return undecided
+    mask = 0
+    for bit in range( 52, -1, -1 ):
+        word = random.getrandbits( numb_bits )
+        if ( threshold >> bit ) & 1:
+            mask |= undecided & ~word       # Random bit 0 below threshold bit 1: less than probability
+            undecided &= word
+        else:
+            undecided &= ~word              # Random bit 1 above threshold bit 0: not less than probability
+        if undecided == 0:
+            break
+    return mask
+
+
+def coveringAttributes(numb_rules):
+    """ Draws the attributes to specify for numb_rules covering classifiers in one pass over numb_rules x numb_attributes positions, consuming the
+    random numbers as numb_rules successive coverings would. """
+    numb_attributes = cons.env.format_data.numb_attributes
+    attributes = [ [] for i in range( numb_rules ) ]
+    for position in randomPositions( numb_rules * numb_attributes, cons.p_spec ):
+        attributes[ position // numb_attributes ].append( position % numb_attributes )
+    return attributes
+
+
+def randomPositions(numb_positions, probability):
+    """ Returns, in increasing order, the positions in range(numb_positions) each selected independently with the given probability. Draws one random
+    number per position, or only about one per selected position with cons.skip_sampling. """
+    if cons.skip_sampling:
+        return skipPositions( numb_positions, probability )
+    return [ position for position in range( numb_positions ) if random.random() < probability ]
+
+
+def skipPositions(numb_positions, probability):
+    """ Returns the positions selected independently with the given probability, in increasing order, by drawing the geometrically distributed
+    number of positions skipped before each selected one. """
+    if probability <= 0.0:
+        return []
+    if probability >= 1.0:
+        return list( range( numb_positions ) )
+    log_skip = math.log1p( -probability )     # Logarithm of the probability of skipping a position
+    positions = []
+    position = int( math.log( 1.0 - random.random() ) / log_skip )
+    while position < numb_positions:
+        positions.append( position )
+        position += 1 + int( math.log( 1.0 - random.random() ) / log_skip )
+    return positions
@@ -11,7 +11,11 @@ Description:
 
 #Import Required Modules---------------------
 from xcs_constants import *
-from xcs_classifier import Classifier
+from xcs_classifier import Classifier, Offspring, coveringAttributes
+from xcs_deletion import buildDeletion
+from xcs_matching import buildMatcher
+from xcs_parameter_store import buildParameterStore
+from xcs_rule_set import RuleSet
 #import crandom as random
 import random
 #--------------------------------------------
@@ -20,10 +24,15 @@ class ClassifierSet:
     def __init__(self, a=None):
         """ Overloaded initialization: Handles creation of a new population or a rebooted population (i.e. a previously saved population). """
         # Major Parameters
-        self.pop_set = []        # List of classifiers/rules
-        self.match_set = []      # List of references to rules in population that match
-        self.action_set = []     # List of references to rules in population that match and has action with highest prediction payoff
+        self.pop_set = RuleSet()       # Classifiers/rules, in insertion order
+        self.match_set = RuleSet()     # References to rules in population that match
+        self.action_set = RuleSet()    # References to rules in population that match and has action with highest prediction payoff
+        self.match_actions = {}        # Rules of the match set by action, each in match set order (actions in order of first appearance)
         self.micro_size = 0   # Tracks the current micro population size, i.e. the population size which takes rule numerosity into account.
+        self.matcher = buildMatcher(self)    # Matching engine, kept up to date with every macro-classifier added to or removed from the population
+        self.deleter = buildDeletion(self)   # Deletion scheme, also told about every change to the parameters its votes depend on
+        self.identical = {}      # Macro-classifiers of the population by key (see Classifier.makeKey), in population order
+        self.store = buildParameterStore()   # Columnar parameter storage of the rules in the population, None when the rules keep their own parameters
 
         # Evaluation Parameters-------------------------------
         self.mean_generality = 0.0
@@ -44,7 +53,7 @@ class ClassifierSet:
     #--------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
     def makePop(self):
         """ Initializes the rule population """
-        self.pop_set = []
+        self.pop_set = RuleSet()
 
 
     def rebootPop(self, remakeFile):
@@ -70,7 +79,7 @@ class ClassifierSet:
         #**************************************************************************************************
         for each in dataset_list:
             cl = Classifier(each)
-            self.pop_set.append(cl)
+            self.insertMacroClassifier(cl)
             numerosity_ref = cons.env.format_data.numb_attributes + 3
             self.micro_size += int(each[numerosity_ref])
         print("Rebooted Rule Population has "+str(len(self.pop_set))+" Macro Pop Size.")
@@ -78,57 +87,49 @@ class ClassifierSet:
     #--------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
     # CLASSIFIER SET CONSTRUCTOR METHODS
     #--------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
-    def makeMatchSet(self, state, iteration, pool=None):
+    def makeMatchSet(self, state, iteration):
         """ Constructs a match set from the population. Covering is initiated if the match set is empty or total prediction of rules in match set is too low. """
-        #Initial values
-        matched_phenotype_list = []
-        self.current_instance = state
         #-------------------------------------------------------
         # MATCHING
         #-------------------------------------------------------
         cons.timer.startTimeMatching()
-        if cons.multiprocessing:
-            results = pool.map( self.parallelMatching, self.pop_set )
-            for cl in results:
-                if cl != None:
-                    self.match_set.append( cl )                 # If match - add classifier to match set
-                    if cl.action not in matched_phenotype_list:
-                        matched_phenotype_list.append( cl.action )
-        else:
-            for cl in self.pop_set:              # Go through the population
-                if cl.match( state ):                             # Check for match
-                    self.match_set.append( cl )                  # If match - add classifier to match set
-                    if cl.action not in matched_phenotype_list:
-                        matched_phenotype_list.append( cl.action )
+        self.setMatchSet( self.matcher.matchSet( state ) )     # Go through the population
         cons.timer.stopTimeMatching()
         #-------------------------------------------------------
         # COVERING
         #-------------------------------------------------------
-        while len(matched_phenotype_list) < cons.theta_mna:
-            missing_actions = [a for a in cons.env.format_data.action_list if a not in matched_phenotype_list]
-            for action in missing_actions:
-                new_cl = Classifier( iteration, state, action )
+        while len(self.match_actions) < cons.theta_mna:
+            missing_actions = [a for a in cons.env.format_data.action_list if a not in self.match_actions]
+            covered_attributes = coveringAttributes( len(missing_actions) )     # Conditions of all the covering rules drawn at once
+            for i in range( len(missing_actions) ):
+                new_cl = Classifier( iteration, state, missing_actions[i], covered_attributes[i] )
                 self.addClassifierToPopulation( new_cl )
                 self.match_set.append( new_cl )  # Add created classifier to match set
-                matched_phenotype_list.append( new_cl.action )
-            if len( matched_phenotype_list ) >= cons.theta_mna:
-                self.deletion()
-                matched_phenotype_list = []
-                for cl in self.match_set:
-                    if cl.action not in matched_phenotype_list:
-                        matched_phenotype_list.append(cl.action)
+                self.match_actions.setdefault( new_cl.action, RuleSet() ).append( new_cl )
+            if len( self.match_actions ) >= cons.theta_mna:
+                self.deletion()     # Rules deleted from the population also leave the match set and its partition
+
+    def setMatchSet(self, matched):
+        """ Makes the given matching rules, in population order, the match set and partitions them by action. """
+        self.match_set = RuleSet( matched )
+        partition = {}
+        for cl in matched:
+            if cl.action in partition:
+                partition[cl.action].append( cl )
+            else:
+                partition[cl.action] = [ cl ]
+        self.match_actions = {}
+        for action in partition:
+            self.match_actions[action] = RuleSet( partition[action] )
 
     def makeActionSet(self, selected_action):
         """ Constructs a correct set out of the given match set. """
-        for mcl in self.match_set:
-            if mcl.action == selected_action:
-                self.action_set.append(mcl)
+        if selected_action in self.match_actions:
+            self.action_set = RuleSet( self.match_actions[selected_action] )
 
     def makeEvalMatchSet(self, state):
         """ Constructs a match set for evaluation purposes which does not activate either covering or deletion. """
-        for cl in self.pop_set:       # Go through the population
-            if cl.match(state):                 # Check for match
-                self.match_set.append(cl)         # Add classifier to match set
+        self.setMatchSet( self.matcher.matchSet( state ) )
 
 
     #--------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
@@ -144,37 +145,49 @@ class ClassifierSet:
     def deleteFromPopulation(self):
         """ Deletes one classifier in the population.  The classifier that will be deleted is chosen by roulette wheel selection
         considering the deletion vote. Returns the macro-classifier which got decreased by one micro-classifier. """
-        mean_fitness = self.getPopFitnessSum()/float(self.micro_size)
-        #Calculate total wheel size------------------------------
-        set_size = len(self.pop_set)
-        vote_sum = 0.0
-        vote_list = [0.0] * set_size
-        for i in range(set_size):
-            cl = self.pop_set[i]
-            vote = cl.getDelProb(mean_fitness)
-            vote_sum += vote
-            vote_list[i] = vote
-        #--------------------------------------------------------
-        choice_point = vote_sum * random.random() #Determine the choice point
-        new_sum = 0.0
-        for i in range(len(vote_list)):
-            new_sum = new_sum + vote_list[i]
-            if new_sum > choice_point: #Select classifier for deletion
-                #Delete classifier----------------------------------
-                cl = self.pop_set[i]
-                cl.updateNumerosity(-1)
-                self.micro_size -= 1
-                if cl.numerosity < 1: # When all micro-classifiers for a given classifier have been depleted.
-                    self.pop_set.pop(i)
-                    if self.match_set != []:
-                        self.deleteFromSets(cl)
-                return
-        print("ClassifierSet: No eligible rules found for deletion in deleteFromPopulation.")
-        return
-
-    def removeMacroClassifier(self, ref):
+        cl = self.deleter.selectDeletion()
+        if cl == None:
+            print("ClassifierSet: No eligible rules found for deletion in deleteFromPopulation.")
+            return
+        #Delete classifier----------------------------------
+        cl.updateNumerosity(-1)
+        self.micro_size -= 1
+        if cl.numerosity < 1: # When all micro-classifiers for a given classifier have been depleted.
+            self.removeMacroClassifier(cl)
+            if len(self.match_set) > 0:
+                self.deleteFromSets(cl)
+        else:
+            self.deleter.updateClassifier(cl)
+
+    def insertMacroClassifier(self, cl):
+        """ Appends a new (macro-) classifier to the population. """
+        self.pop_set.append(cl)
+        if self.store != None:
+            self.store.attach(cl)
+        self.matcher.addClassifier(cl)
+        self.deleter.addClassifier(cl)
+        self.identical.setdefault(cl.key, []).append(cl)
+
+    def removeMacroClassifier(self, cl):
         """ Removes the specified (macro-) classifier from the population. """
-        self.pop_set.pop(ref)
+        self.pop_set.remove(cl)
+        self.releaseMacroClassifier(cl)
+
+    def removeMacroClassifiers(self, removed):
+        """ Removes the given (macro-) classifiers from the population. """
+        for cl in removed:
+            self.removeMacroClassifier(cl)
+
+    def releaseMacroClassifier(self, cl):
+        """ Tells the matching engine, the deletion scheme and the identical-rule index that cl has left the population. """
+        self.matcher.removeClassifier(cl)
+        self.deleter.removeClassifier(cl)
+        same_key = self.identical[cl.key]
+        same_key.remove(cl)
+        if not same_key:
+            del self.identical[cl.key]
+        if self.store != None:
+            self.store.detach(cl)
 
     def deleteFromSets(self, cl):
         """ delete cl from action set and match set. """
@@ -183,6 +196,7 @@ class ClassifierSet:
         except ValueError:
             pass
         else:
+            self.deleteFromMatchPartition(cl)
             try:
                 self.action_set.remove(cl)
             except ValueError:
@@ -194,6 +208,14 @@ class ClassifierSet:
             self.match_set.remove(cl)
         except ValueError:
             return
+        self.deleteFromMatchPartition(cl)
+
+    def deleteFromMatchPartition(self, cl):
+        """ Delete reference to classifier of the match set from the rules of its action, dropping the action when it has no rule left. """
+        same_action = self.match_actions[cl.action]
+        same_action.remove(cl)
+        if len(same_action) == 0:
+            del self.match_actions[cl.action]
 
     def deleteFromActionSet(self, cl):
         """ Delete reference to classifier in population, contained in self.action_set."""
@@ -240,24 +262,34 @@ class ClassifierSet:
         #-------------------------------------------------------
         # INITIALIZE OFFSPRING
         #-------------------------------------------------------
-        cl1  = Classifier(clP1, iteration)
+        cl1  = Offspring(clP1, iteration)
         if clP2 == None:
-            cl2 = Classifier(clP1, iteration)
+            cl2 = Offspring(clP1, iteration)
         else:
-            cl2 = Classifier(clP2, iteration)
+            cl2 = Offspring(clP2, iteration)
         #-------------------------------------------------------
         # CROSSOVER OPERATOR - Uniform Crossover Implemented (i.e. all attributes have equal probability of crossing over between two parents)
         #-------------------------------------------------------
         if not cl1.equals(cl2) and random.random() < cons.chi:
             if cons.crossover_method == 'uniform':
-                changed = cl1.uniformCrossover(cl2)
+                if cons.ga_operators == 'masks':
+                    changed = cl1.maskUniformCrossover(cl2)
+                else:
+                    changed = cl1.uniformCrossover(cl2)
             elif cons.crossover_method == 'twopoint':
-                changed = cl1.twoPointCrossover(cl2)
+                if cons.ga_operators == 'masks':
+                    changed = cl1.maskTwoPointCrossover(cl2)
+                else:
+                    changed = cl1.twoPointCrossover(cl2)
         #-------------------------------------------------------
         # MUTATION OPERATOR
         #-------------------------------------------------------
-        mutate_change1 = cl1.Mutation(state)
-        mutate_change2 = cl2.Mutation(state)
+        if cons.ga_operators == 'masks':
+            mutate_change1 = cl1.maskMutation(state)
+            mutate_change2 = cl2.maskMutation(state)
+        else:
+            mutate_change1 = cl1.Mutation(state)
+            mutate_change2 = cl2.Mutation(state)
         #-------------------------------------------------------
         # INITIALIZE KEY OFFSPRING PARAMETERS
         #-------------------------------------------------------
@@ -284,7 +316,7 @@ class ClassifierSet:
         #Prepare for actionSet set or 'niche' selection.
         selected_list = [None, None]
         count = 0 #Pick two parents
-        set_list = self.action_set[:]
+        set_list = list(self.action_set)
         #-----------------------------------------------
         while count < 2:
             fit_sum = self.getFitnessSum(set_list)
@@ -307,7 +339,7 @@ class ClassifierSet:
         """  Selects parents using tournament selection according to the fitness of the classifiers. """
         selected_list = [None, None]
         count = 0
-        set_list = self.action_set[:] #actionSet set is a list of reference IDs
+        set_list = list(self.action_set) #actionSet set is a list of reference IDs
         # -----------------------------------------------
         while count < 2:
             tournament_size = int(len(set_list)*cons.theta_sel)
@@ -377,9 +409,11 @@ class ClassifierSet:
         if cl1P!=None and cl1P.subsumes(cl):
             self.micro_size += num_copy
             cl1P.updateNumerosity(num_copy)
+            self.deleter.updateClassifier(cl1P)
         elif cl2P!=None and cl2P.subsumes(cl):
             self.micro_size += num_copy
             cl2P.updateNumerosity(num_copy)
+            self.deleter.updateClassifier(cl2P)
         else:
             #self.addClassifierToPopulation(cl)
             self.subsumeClassifier2(cl, num_copy)     #Try to subsume in the match set.
@@ -395,6 +429,7 @@ class ClassifierSet:
         if len(choices) > 0: #Randomly pick one classifier to be subsumer
             choicep = int( random.random()*len(choices) )
             choices[choicep].updateNumerosity(num_copy)
+            self.deleter.updateClassifier(choices[choicep])
             self.micro_size += num_copy
             return
 
@@ -410,15 +445,12 @@ class ClassifierSet:
                     subsumer = cl
 
         if subsumer != None: #If a subsumer was found, subsume all more specific classifiers in the match set
-            i=0
-            while i < len(self.action_set):
-                cl = self.action_set[i]
+            for cl in list(self.action_set):
                 if subsumer.isMoreGeneral(cl):
                     subsumer.updateNumerosity(cl.numerosity)
-                    self.pop_set.remove(cl)
+                    self.deleter.updateClassifier(subsumer)
+                    self.removeMacroClassifier(cl)
                     self.deleteFromSets(cl)
-                    i = i - 1
-                i = i + 1
 
 
     #--------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
@@ -432,9 +464,12 @@ class ClassifierSet:
         self.micro_size += num_copy
         if old_cl != None: #found identical classifier
             old_cl.updateNumerosity(num_copy)
+            self.deleter.updateClassifier(old_cl)
             return old_cl
         else:
-            self.pop_set.append(cl)
+            if isinstance(cl, Offspring):
+                cl.materialize()
+            self.insertMacroClassifier(cl)
             return cl
 
     def insertDiscoveredClassifiers(self, cl1, cl2, clP1, clP2):
@@ -469,6 +504,11 @@ class ClassifierSet:
 
     def updateSets(self, reward):
         """ Updates all relevant parameters in the current match and match sets. """
+        if self.store != None:
+            self.store.updateActionSet( [ cl.slot for cl in self.action_set ], reward )
+            for cl in self.action_set:
+                self.deleter.updateClassifier(cl)
+            return
         action_set_numer = 0
         for cl in self.action_set:
             action_set_numer += cl.numerosity
@@ -480,6 +520,7 @@ class ClassifierSet:
             accuracy_sum += cl.accuracy * cl.numerosity
         for cl in self.action_set:
             cl.updateFitness( cl.accuracy * cl.numerosity / accuracy_sum )
+            self.deleter.updateClassifier(cl)
 
 
     #--------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
@@ -487,6 +528,11 @@ class ClassifierSet:
     #--------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
     def getIterStampAverage(self):
         """ Returns the average of the time stamps in the match set. """
+        if self.store != None:
+            slots = [ cl.slot for cl in self.action_set ]
+            numerosity = self.store.column('numerosity')[slots]
+            sum_cl = self.store.sequentialSum( self.store.column('ga_timestamp')[slots] * numerosity )
+            return sum_cl/float( self.store.sequentialSum( numerosity ) )
         sum_cl = 0.0
         sum_numer = 0.0
         for cl in self.action_set:
@@ -512,22 +558,25 @@ class ClassifierSet:
 
     def getPopFitnessSum(self):
         """ Returns the sum of the fitnesses of all classifiers in the set. """
+        if self.store != None:
+            return self.store.sequentialSum( self.store.column('fitness')[ self.store.activeSlots() ] )
         sum_cl = 0.0
         for cl in self.pop_set:
             sum_cl += cl.fitness
         return sum_cl
 
     def getIdenticalClassifier(self, new_cl):
-        """ Looks for an identical classifier in the population. """
-        for mcl in self.match_set:
-            if new_cl.equals(mcl):
-                return mcl
+        """ Looks for an identical classifier (same action and (attribute, value) pairs) in the population. """
+        same_key = self.identical.get(new_cl.key)
+        if same_key:
+            return same_key[0]
         return None
 
     def clearSets(self):
         """ Clears out references in the match and action sets for the next learning iteration. """
-        self.match_set = []
-        self.action_set = []
+        self.match_set = RuleSet()
+        self.action_set = RuleSet()
+        self.match_actions = {}
 
     #--------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
     # EVALUTATION METHODS
@@ -536,8 +585,12 @@ class ClassifierSet:
         """ Calculates some summary evaluations across the rule population including average generality. """
         generality_sum = 0
         #agedCount = 0
-        for cl in self.pop_set:
-            generality_sum += (cons.env.format_data.numb_attributes - len(cl.condition)) * cl.numerosity
+        if self.store != None:
+            slots = self.store.activeSlots()
+            generality_sum = int( ( ( cons.env.format_data.numb_attributes - self.store.column('specificity')[slots] ) * self.store.column('numerosity')[slots] ).sum() )
+        else:
+            for cl in self.pop_set:
+                generality_sum += (cons.env.format_data.numb_attributes - len(cl.condition)) * cl.numerosity
         if self.micro_size == 0:
             self.mean_generality = 'NA'
         else:
@@ -572,37 +625,74 @@ class ClassifierSet:
         #     print(("Epoch: "+str(int(iteration/tracking_frequency))+"\t Iteration: " + str(iteration) + "\t MacroPop: " + str(len(self.pop_set))+ "\t MicroPop: " + str(self.micro_size) + "\t AccEstimate: " + str(accuracy) + "\t AveGen: " + str(self.mean_generality) + "\t PhenRange: " +str(self.avg_action_range) + "\t Time: " + str(cons.timer.returnGlobalTimer())))
         return population_info
 
-    def parallelMatching( self, cl ): #( ( indices, condition, state, id ) ):
-        """ used when multiprocessing is enabled. """
-        if cl.match( self.current_instance ):
-            return cl
-        return None
-
     def finalise(self, do_compact=False):
         """ Compact the population. """
         ### Remove inexperienced and inaccurate classifiers -------------------------
-        i = 0
-        while i < len(self.pop_set):
-            cl = self.pop_set[i]
+        removed = []
+        for cl in self.pop_set:
             if cl.action_cnt <= cons.theta_del or cl.error >= 0.0001:
                 self.micro_size -= cl.numerosity
-                self.pop_set.pop(i)
-            else:
-                i += 1
+                removed.append(cl)
+        self.removeMacroClassifiers(removed)
         ### Subsume overspecific classifiers ----------------------------------------
         if do_compact:
-            i = 0
-            while i < len(self.pop_set):
-                j = i + 1
-                while j < len(self.pop_set):
-                    if self.pop_set[i].compactSubsumes( self.pop_set[j] ):
-                        self.pop_set[i].numerosity += self.pop_set[j].numerosity
-                        self.pop_set.pop(j)
-                        continue
-                    elif self.pop_set[j].compactSubsumes( self.pop_set[i] ):
-                        self.pop_set[j].numerosity += self.pop_set[i].numerosity
-                        self.pop_set.pop(i)
-                        i -= 1
-                        break
-                    j += 1
-                i += 1
\ No newline at end of file
+            self.removeMacroClassifiers( self.compactPopulation() )
+
+    def compactPopulation(self):
+        """ Merges the numerosity of overspecific classifiers into the classifiers that subsume them (see Classifier.compactSubsumes), and returns the
+        merged classifiers, to be removed. The result is the one of the pairwise scan in which every rule, in population order, absorbs the later rules it
+        subsumes until it meets a later rule strictly more general than itself, and is then absorbed by that rule. Subsumption relations are found from
+        an index of (action, attribute, value) pairs instead of comparing every pair of rules. """
+        pop_set = list(self.pop_set)
+        size = len(pop_set)
+        holders = {}    # Positions of the rules specifying each (action, attribute, value)
+        general = {}    # Positions of the rules of each action that specify no attribute
+        for position in range(size):
+            action, pairs = pop_set[position].key
+            if pairs:
+                for pair in pairs:
+                    holders.setdefault( (action,) + pair, set() ).add(position)
+            else:
+                general.setdefault( action, set() ).add(position)
+        #Rules subsumed by each rule (including identical ones), and rules strictly more general than each rule--------
+        subsumed = [None] * size
+        generalisers = [ [] for _ in range(size) ]
+        for position in range(size):
+            action, pairs = pop_set[position].key
+            if pairs:
+                postings = sorted( [ holders[ (action,) + pair ] for pair in pairs ], key=len )
+                subsumed[position] = postings[0].intersection( *postings[1:] )
+            else:
+                subsumed[position] = set( general[action] )
+                for pair_key in holders:
+                    if pair_key[0] == action:
+                        subsumed[position] |= holders[pair_key]
+            specificity = len(pairs)
+            for other in subsumed[position]:
+                if len( pop_set[other].key[1] ) > specificity:
+                    generalisers[other].append(position)
+        #Replay the scan---------------------------------------------------------------------------------------------
+        live = [True] * size
+        removed = []
+        for position in range(size):
+            if not live[position]:
+                continue
+            cl = pop_set[position]
+            absorber = None
+            for other in sorted( generalisers[position] ):
+                if other > position and live[other]:
+                    absorber = other
+                    break
+            end = size if absorber == None else absorber
+            for other in subsumed[position]:
+                if position < other < end and live[other]:
+                    cl.numerosity += pop_set[other].numerosity
+                    live[other] = False
+                    removed.append( pop_set[other] )
+            self.deleter.updateClassifier(cl)
+            if absorber != None:
+                pop_set[absorber].numerosity += cl.numerosity
+                self.deleter.updateClassifier( pop_set[absorber] )
+                live[position] = False
+                removed.append(cl)
+        return removed
\ No newline at end of file
@@ -19,7 +19,10 @@ class Constants:
         self.online_data_generator = False if par[ 'onlineProblem' ].lower()=='false' else True     # Saved as Boolean
         self.train_file = par['trainFile']                                      # Saved as text
         self.test_file = par['testFile']                                        # Saved as text
+        self.data_cache = bool( int( par['dataCache'] ) )                       # Saved as Boolean
+        self.data_storage = par['dataStorage']                                  # Saved as text
         self.kfold_cv = bool(int(par['crossValidation']))
+        self.parallel_folds = int( par['parallelFolds'] )                       # Saved as integer
         if self.online_data_generator:
             self.problem_name = par[ 'onlineProblem' ]
             sizes = par[ 'problemSizes' ].split( '.' )
@@ -37,6 +40,11 @@ class Constants:
                 test_file_without_dir = self.test_file.split('/')[-1]
                 self.out_file = self.outfile_dir+'XCS_'+test_file_without_dir         # Saved as text
         self.multiprocessing = bool( int( par['multiprocessing'] ) )
+        self.matching_method = par['matchingMethod']                            #Saved as text
+        self.match_set_cache = bool( int( par['matchSetCache'] ) )              #Saved as Boolean
+        self.background_evaluation = bool( int( par['backgroundEvaluation'] ) ) #Saved as Boolean
+        self.deletion_method = par['deletionMethod']                            #Saved as text
+        self.parameter_storage = par['parameterStorage']                        #Saved as text
         self.train_file = par['trainFile']                                      #Saved as text
         self.test_file = par['testFile']                                        #Saved as text
         self.checkpoint_iter = par['learningIterations']                        #Saved as text
@@ -85,6 +93,8 @@ class Constants:
         self.distinct_parents = bool(int(par['differentParent'])) #Saved as Boolean
         self.theta_sel = float(par['theta_sel'])                                #Saved as float
         self.crossover_method = par['crossoverMethod']                          #Saved as text
+        self.ga_operators = par['gaOperators']                                  #Saved as text
+        self.skip_sampling = bool( int( par['skipSampling'] ) )                 #Saved as Boolean
 
         # PopulationReboot -------------------------------------------------------------------------------
         self.do_pop_reboot = bool(int(par['doPopulationReboot']))               #Saved as Boolean
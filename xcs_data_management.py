@@ -10,11 +10,21 @@ XCS: Michigan-style Learning Classifier System - A LCS for Reinforcement Learnin
 ---------------------------------------------------------------------------------------------------------------------------------------------------------
 """
 #Import Required Modules---------------
+from array import array
+from collections import Counter, deque
+import hashlib
+from itertools import islice
 from javarandom import Random as JRandom
+import os
+import pickle
 import random
 from xcs_constants import cons
+from xcs_instance_storage import RecordStore, RecordInstances
 #--------------------------------------
 
+CHUNK_ROWS = 10000    # Rows read and converted at a time
+CACHE_VERSION = 2     # Format of the data cache files, changed whenever their content changes
+
 class DataManagement:
     def __init__(self, train_file, test_file):
         #Initialize global variables-------------------------------------------------
@@ -27,6 +37,8 @@ class DataManagement:
         self.attribute_info = []         # Stores Discrete (0) or Continuous (1) for each attribute
         self.action_list = []         # Stores all possible discrete phenotype states/classes or maximum and minimum values for a continuous phenotype
         self.action_range = None      # Stores the difference between the maximum and minimum values for a continuous phenotype
+        self.binary_attributes = False   # Are all attributes discrete with only 0/1 states? (If so, rule conditions can be matched as packed bitmasks)
+        self.record_storage = cons.data_storage in ( 'arrays', 'mapped' )   # Are the formatted instances kept as binary records? (Otherwise in lists)
 
         #Train/Test Specific-----------------------------------------------------------------------------
         self.train_headers = []       # The dataset column headers for the training data
@@ -39,39 +51,55 @@ class DataManagement:
         print("----------------------------------------------------------------------------")
         print("Environment: Formatting Data... ")
 
+        if cons.data_storage not in ( 'lists', 'arrays', 'mapped' ):
+            print("DataManagement: Warning - unknown data storage '"+str(cons.data_storage)+"', instances are kept in lists.")
+        use_cache = cons.data_cache
+        if use_cache and cons.data_storage == 'mapped':
+            print("DataManagement: Warning - the data cache holds the instances in memory, it is not used with mapped data storage.")
+            use_cache = False
+        if use_cache:
+            cache_file = train_file + '.cache'
+            cache_key = cacheKey(train_file, test_file)
+            if self.loadCache(cache_file, cache_key, train_file, test_file):
+                print("----------------------------------------------------------------------------")
+                return
+
         #Detect Features of training data--------------------------------------------------------------------------
-        raw_train_data = self.loadData(train_file, True) #Load the raw data.
+        train_instances, train_columns = self.loadData(train_file, True) #Read the data once, summarizing each column.
 
-        self.characterizeDataset(raw_train_data)  #Detect number of attributes, instances, and reference locations.
+        self.characterizeDataset(train_instances)  #Detect number of attributes, instances, and reference locations.
 
         if cons.test_file == 'None': #If no testing data is available, formatting relies solely on training data.
-            tobe_formatted = raw_train_data
+            test_columns = None
         else:
-            raw_test_data = self.loadData(test_file, False) #Load the raw data.
-            self.compareDataset(raw_test_data) #Ensure that key features are the same between training and testing datasets.
-            tobe_formatted = raw_train_data + raw_test_data #Merge Training and Testing datasets
+            test_instances, test_columns = self.loadData(test_file, False, train_columns) #Read the data once, summarizing each column.
+            self.compareDataset(test_instances) #Ensure that key features are the same between training and testing datasets.
 
-        self.discriminatePhenotype(tobe_formatted) #Determine if endpoint/phenotype is discrete or continuous.
+        self.discriminatePhenotype(train_columns) #Determine if endpoint/phenotype is discrete or continuous.
         if self.discrete_action:
-            self.discriminateClasses(tobe_formatted) #Detect number of unique phenotype identifiers.
+            self.discriminateClasses(train_columns) #Detect number of unique phenotype identifiers.
         else:
-            self.characterizePhenotype(tobe_formatted)
+            self.characterizePhenotype(train_columns, test_columns)
 
-        self.discriminateAttributes(tobe_formatted) #Detect whether attributes are discrete or continuous.
-        self.characterizeAttributes(tobe_formatted) #Determine potential attribute states or ranges.
+        self.discriminateAttributes(train_columns) #Detect whether attributes are discrete or continuous.
+        self.characterizeAttributes(train_columns, test_columns) #Determine potential attribute states or ranges.
+        self.detectBinaryAttributes() #Determine if every attribute is binary.
 
         #Format and Shuffle Datasets----------------------------------------------------------------------------------------
         if cons.test_file != 'None':
-            self.formatted_test_data = self.formatData(raw_test_data) #Stores the formatted testing data set used throughout the algorithm.
+            self.formatted_test_data = self.formatData(test_file) #Stores the formatted testing data set used throughout the algorithm.
 
-        self.formatted_train_data = self.formatData(raw_train_data) #Stores the formatted training data set used throughout the algorithm.
+        self.formatted_train_data = self.formatData(train_file) #Stores the formatted training data set used throughout the algorithm.
+        if use_cache:
+            self.saveCache(cache_file, cache_key, dataDigest(train_file, test_file))
         print("----------------------------------------------------------------------------")
 
 
-    def loadData(self, dat_file, do_train):
-        """ Load the data file. """
+    def loadData(self, dat_file, do_train, train_columns=None):
+        """ Reads the data file once, in chunks, and returns the number of instances and a ColumnProfile of each column. Training columns are profiled up
+        to the discrete attribute limit. Testing columns are profiled as the training columns turned out: every state of a column that is discrete in the
+        training data is kept, only the range of the others. No row is kept in memory. """
         print("DataManagement: Loading Data... " + str(dat_file))
-        dataset_list = []
         try:
             f = open(dat_file,'r')
         except Exception as inst:
@@ -81,19 +109,24 @@ class DataManagement:
             print('cannot open', dat_file)
             raise
         else:
+            headers = f.readline().rstrip('\n').split('\t')   #strip off first row
             if do_train:
-                self.train_headers = f.readline().rstrip('\n').split('\t')   #strip off first row
+                self.train_headers = headers
+                columns = [ ColumnProfile( cons.discrete_attribute_limit ) for _ in headers ]
             else:
-                self.test_headers = f.readline().rstrip('\n').split('\t')   #strip off first row
-            for line in f:
-                line_list = line.strip('\n').split('\t')
-                dataset_list.append(line_list)
+                self.test_headers = headers
+                columns = [ ColumnProfile( None if train_column.counts != None else 0 ) for train_column in train_columns ]
+            numb_instances = 0
+            for rows in readChunks(f, len(headers)):
+                numb_instances += len(rows)
+                for column, values in zip( columns, zip(*rows) ):
+                    column.update( values )
             f.close()
 
-        return dataset_list
+        return numb_instances, columns
 
 
-    def characterizeDataset(self, raw_train_data):
+    def characterizeDataset(self, numb_train_instances):
         " Detect basic dataset parameters "
         #Detect Instance ID's and save location if they occur.  Then save number of attributes in data.
         if cons.ID_label in self.train_headers:
@@ -124,54 +157,39 @@ class DataManagement:
 
         #Store number of instances in training data
         print("DataManagement: Number of Attributes = " + str(self.numb_attributes))
-        self.numb_train_instances = len(raw_train_data)
+        self.numb_train_instances = numb_train_instances
         if cons.kfold_cv == False:
             print("DataManagement: Number of Instances = " + str(self.numb_train_instances))
 
 
-    def discriminatePhenotype(self, raw_data):
+    def discriminatePhenotype(self, columns):
         """ Determine whether the phenotype is Discrete(class-based) or Continuous """
         print("DataManagement: Analyzing Phenotype...")
-        inst = 0
-        class_dict = {}
-        while self.discrete_action and len(list(class_dict.keys())) <= cons.discrete_attribute_limit and inst < self.numb_train_instances:  #Checks which discriminate between discrete and continuous attribute
-            target = raw_data[inst][self.action_ref]
-            if target in list(class_dict.keys()):  #Check if we've seen this attribute state yet.
-                class_dict[target] += 1
-            elif target == cons.missing_label: #Ignore missing data
-                print("DataManagement: Warning - Individual detected with missing phenotype information!")
-                pass
-            else: #New state observed
-                class_dict[target] = 1
-            inst += 1
-
-        if len(list(class_dict.keys())) > cons.discrete_attribute_limit:
+        phenotypes = columns[self.action_ref]
+        for _ in range(phenotypes.missing_before): #Missing data met before the phenotype was found continuous is ignored
+            print("DataManagement: Warning - Individual detected with missing phenotype information!")
+
+        if phenotypes.counts == None: #More distinct phenotypes than cons.discrete_attribute_limit
             self.discrete_action = False
-            self.action_list = [float(target),float(target)]
+            self.action_list = [float(phenotypes.exceeding),float(phenotypes.exceeding)]
             print("DataManagement: Phenotype Detected as Continuous.")
         else:
             print("DataManagement: Phenotype Detected as Discrete.")
 
 
-    def discriminateClasses(self, raw_data):
+    def discriminateClasses(self, columns):
         """ Determines number of classes and their identifiers. Only used if phenotype is discrete. """
         print("DataManagement: Detecting Classes...")
-        inst = 0
-        class_count = {}
-        while inst < self.numb_train_instances:
-            target = raw_data[inst][self.action_ref]
-            if int(target) in self.action_list:
-                class_count[target] += 1
-            else:
+        phenotypes = columns[self.action_ref]
+        for target in phenotypes.states():
+            if int(target) not in self.action_list:
                 self.action_list.append( int(target) )
-                class_count[target] = 1
-            inst += 1
         print("DataManagement: Following Classes Detected:" + str(self.action_list))
-        for each in list(class_count.keys()):
-            print("Class: "+str(each)+ " count = "+ str(class_count[each]))
+        for each in phenotypes.states():
+            print("Class: "+str(each)+ " count = "+ str(phenotypes.counts[each]))
 
 
-    def compareDataset(self, raw_test_data):
+    def compareDataset(self, numb_test_instances):
         " Ensures that the attributes in the testing data match those in the training data.  Also stores some information about the testing data. "
         if self.are_instanceIDs:
             if self.action_ref > self.instanceID_ref:
@@ -187,34 +205,20 @@ class DataManagement:
             print("DataManagement: Error - Training and Testing Dataset Headers are not equivalent")
 
         # Stores the number of instances in the testing data.
-        self.numb_test_instances = len(raw_test_data)
+        self.numb_test_instances = numb_test_instances
         print("DataManagement: Number of Attributes = " + str(self.numb_attributes))
         print("DataManagement: Number of Instances = " + str(self.numb_test_instances))
 
 
-    def discriminateAttributes(self, raw_data):
+    def discriminateAttributes(self, columns):
         """ Determine whether attributes in dataset are discrete or continuous and saves this information. """
         print("DataManagement: Detecting Attributes...")
         self.discrete_count = 0
         self.continuous_count = 0
-        for att in range(len(raw_data[0])):
+        for att in range(len(columns)):
             if att != self.instanceID_ref and att != self.action_ref:  #Get just the attribute columns (ignores phenotype and instanceID columns)
-                is_att_discrete = True
-                inst = 0
-                state_dict = {}
-                while is_att_discrete and len(list(state_dict.keys())) <= cons.discrete_attribute_limit and inst < self.numb_train_instances:  #Checks which discriminate between discrete and continuous attribute
-                    target = raw_data[inst][att]
-                    if target in list(state_dict.keys()):  #Check if we've seen this attribute state yet.
-                        state_dict[target] += 1
-                    elif target == cons.missing_label: #Ignore missing data
-                        pass
-                    else: #New state observed
-                        state_dict[target] = 1
-                    inst += 1
-
-                if len(list(state_dict.keys())) > cons.discrete_attribute_limit:
-                    is_att_discrete = False
-                if is_att_discrete:
+                target = columns[att].exceeding
+                if columns[att].counts != None: #At most cons.discrete_attribute_limit distinct states
                     self.attribute_info.append([0,[]])
                     self.discrete_count += 1
                 else:
@@ -223,101 +227,185 @@ class DataManagement:
         print("DataManagement: Identified "+str(self.discrete_count)+" discrete and "+str(self.continuous_count)+" continuous attributes.") #Debug
 
 
-    def characterizeAttributes(self, raw_data):
+    def characterizeAttributes(self, train_columns, test_columns):
         """ Determine range (if continuous) or states (if discrete) for each attribute and saves this information"""
         print("DataManagement: Characterizing Attributes...")
         attributeID = 0
-        for att in range(len(raw_data[0])):
+        for att in range(len(train_columns)):
             if att != self.instanceID_ref and att != self.action_ref:  #Get just the attribute columns (ignores phenotype and instanceID columns)
-                for inst in range(len(raw_data)):
-                    target = raw_data[inst][att]
-                    if not self.attribute_info[attributeID][0]: #If attribute is discrete
-                        if target in self.attribute_info[attributeID][1] or target == cons.missing_label:
-                            pass  #NOTE: Could potentially store state frequency information to guide learning.
-                        else:
-                            self.attribute_info[attributeID][1].append(target)
+                profiles = [ train_columns[att] ]
+                if test_columns != None:
+                    profiles.append( test_columns[att] )
+                for column in profiles:
+                    if not self.attribute_info[attributeID][0]: #If attribute is discrete, states are kept in order of first appearance
+                        known = set( self.attribute_info[attributeID][1] )
+                        for target in column.states():
+                            if target not in known:
+                                self.attribute_info[attributeID][1].append(target)
+                                known.add(target)
                     else: #If attribute is continuous
-
-                        #Find Minimum and Maximum values for the continuous attribute so we know the range.
-                        if target == cons.missing_label:
-                            pass
-                        elif float(target) > self.attribute_info[attributeID][1][1]:  #error
-                            self.attribute_info[attributeID][1][1] = float(target)
-                        elif float(target) < self.attribute_info[attributeID][1][0]:
-                            self.attribute_info[attributeID][1][0] = float(target)
-                        else:
-                            pass
+                        column.widenRange( self.attribute_info[attributeID][1] )
                 attributeID += 1
 
 
-    def characterizePhenotype(self, raw_data):
+    def detectBinaryAttributes(self):
+        """ Determine whether every attribute is discrete with states limited to 0 and 1. """
+        self.binary_attributes = True
+        for info in self.attribute_info:
+            if info[0]: #Continuous attribute
+                self.binary_attributes = False
+                return
+            for state in info[1]:
+                if state not in ('0', '1'):
+                    self.binary_attributes = False
+                    return
+
+
+    def characterizePhenotype(self, train_columns, test_columns):
         """ Determine range of phenotype values. """
         print("DataManagement: Characterizing Phenotype...")
-        for inst in range(len(raw_data)):
-            target = raw_data[inst][self.action_ref]
-
-            #Find Minimum and Maximum values for the continuous phenotype so we know the range.
-            if target == cons.missing_label:
-                pass
-            elif float(target) > self.action_list[1]:
-                self.action_list[1] = float(target)
-            elif float(target) < self.action_list[0]:
-                self.action_list[0] = float(target)
-            else:
-                pass
+        train_columns[self.action_ref].widenRange( self.action_list )
+        if test_columns != None:
+            test_columns[self.action_ref].widenRange( self.action_list )
         self.action_range = self.action_list[1] - self.action_list[0]
 
 
-    def formatData(self,raw_data):
-        """ Get the data into a format convenient for the algorithm to interact with. Specifically each instance is stored in a list as follows; [Attribute States, Phenotype, InstanceID] """
-        formatted = []
-        #Initialize data format---------------------------------------------------------
-        for _ in range(len(raw_data)):
-            formatted.append([None,None,None]) #[Attribute States, Phenotype, InstanceID]
-
-        for inst in range(len(raw_data)):
-            state_list = [0] * self.numb_attributes
-            attributeID = 0
-            for att in range(len(raw_data[0])):
-                if att != self.instanceID_ref and att != self.action_ref:  #Get just the attribute columns (ignores phenotype and instanceID columns)
-                    target = raw_data[inst][att]
-
-                    if self.attribute_info[attributeID][0]: #If the attribute is continuous
-                        if target == cons.missing_label:
-                            state_list[attributeID] = target #Missing data saved as text label
-                        else:
-                            state_list[attributeID] = float(target) #Save continuous data as floats.
-                    else: #If the attribute is discrete - Format the data to correspond to the GABIL (DeJong 1991)
-                        if target == cons.missing_label:
-                            state_list[attributeID] = target
-                        else:
-                            state_list[attributeID] = int(target) #missing data, and discrete variables, all stored as string objects
-                    attributeID += 1
-
-            #Final Format-----------------------------------------------
-            formatted[inst][0] = state_list                           #Attribute states stored here
+    def formatData(self, dat_file):
+        """ Get the data into a format convenient for the algorithm to interact with. Specifically each instance is stored in a list as follows; [Attribute States, Phenotype, InstanceID]
+        The file is read again in chunks and each chunk is converted column by column. With record storage the instances are written to a RecordStore
+        (in memory, or in a temporary file with mapped storage), and a RecordInstances view of it is returned. """
+        if self.record_storage:
+            records = RecordStore(self.attribute_info, self.discrete_action, self.are_instanceIDs, cons.data_storage == 'mapped')
+        else:
+            formatted = []
+        numb_columns = len(self.attribute_info) + 1 + self.are_instanceIDs
+        attribute_refs = [ att for att in range(numb_columns) if att != self.instanceID_ref and att != self.action_ref ]
+        f = open(dat_file,'r')
+        f.readline()   #strip off first row
+        for rows in readChunks(f, numb_columns):
+            columns = list(zip(*rows))
+            states = []
+            for attributeID in range(self.numb_attributes):
+                if self.attribute_info[attributeID][0]: #If the attribute is continuous, save continuous data as floats.
+                    states.append( formatColumn( columns[ attribute_refs[attributeID] ], float ) )
+                else: #If the attribute is discrete - Format the data to correspond to the GABIL (DeJong 1991)
+                    states.append( formatColumn( columns[ attribute_refs[attributeID] ], int ) ) #Missing data saved as text label
             if self.discrete_action:
-                formatted[inst][1] = int( raw_data[inst][self.action_ref] )       #phenotype stored here
+                phenotypes = map( int, columns[self.action_ref] )
             else:
-                formatted[inst][1] = float( raw_data[inst][self.action_ref] )
+                phenotypes = map( float, columns[self.action_ref] )
             if self.are_instanceIDs:
-                formatted[inst][2] = int( raw_data[inst][self.instanceID_ref] )   #Instance ID stored here
+                instanceIDs = map( int, columns[self.instanceID_ref] )
             else:
-                pass    #instance ID neither given nor required.
-            #-----------------------------------------------------------
+                instanceIDs = [None] * len(rows)    #instance ID neither given nor required.
+            if self.record_storage:
+                records.write( zip( zip(*states), phenotypes, instanceIDs ) )
+            else:
+                formatted.extend( [ list(state_list), phenotype, instanceID ] for state_list, phenotype, instanceID in zip( zip(*states), phenotypes, instanceIDs ) )
+        f.close()
+        if self.record_storage:
+            records.finishWriting()
+            formatted = RecordInstances( records, array( 'q', range(records.numb_records) ) )
         #random.shuffle(formatted) #One time randomization of the order the of the instances in the data, so that if the data was ordered by phenotype, this potential learning bias (based on instance ordering) is eliminated.
-        randomize( formatted, self.jrnd )
+        randomize( permutation(formatted), self.jrnd )
         return formatted
 
+    def saveCache(self, cache_file, cache_key, digest):
+        """ Writes the formatted datasets, the detected dataset features and the state of the shuffling generator to cache_file. The key and the digest
+        of the data files are written first, on their own, so that a stale cache is recognised without reading the data. """
+        fields = dict( self.__dict__ )
+        for name in ( 'jrnd', 'formatted_train_data', 'formatted_test_data' ):
+            fields.pop( name, None )
+        try:
+            datasets = { 'train': self.packData( self.formatted_train_data ) }
+            if cons.test_file != 'None':
+                datasets['test'] = self.packData( self.formatted_test_data )
+            f = open( cache_file + '.tmp', 'wb' )
+            pickle.dump( ( cache_key, digest ), f, pickle.HIGHEST_PROTOCOL )
+            pickle.dump( ( fields, ( self.jrnd._seed, self.jrnd.nextNextGaussian ), datasets ), f, pickle.HIGHEST_PROTOCOL )
+            f.close()
+            os.replace( cache_file + '.tmp', cache_file )
+        except Exception as inst:
+            print("DataManagement: Warning - data cache could not be written to "+str(cache_file)+": "+str(inst))
+        else:
+            print("DataManagement: Data cached in " + str(cache_file))
+
+    def loadCache(self, cache_file, cache_key, train_file, test_file):
+        """ Restores the state saved by saveCache if cache_file holds the data for cache_key. The data files are only hashed when the key (which
+        holds their sizes and modification times) matches, to confirm that their content is the one cached. Returns whether the state was restored.
+        The cache is unpickled, so it must be trusted like the code: a cache file planted next to the training file could run code when loaded. """
+        if not os.path.exists( cache_file ):
+            return False
+        try:
+            f = open( cache_file, 'rb' )
+            header = pickle.load( f )     # ( key, digest of the data files )
+            if len(header) != 2 or header[0] != cache_key or header[1] != dataDigest(train_file, test_file):
+                f.close()
+                return False
+            print("DataManagement: Loading Cached Data... " + str(cache_file))
+            fields, jrnd_state, datasets = pickle.load( f )
+            f.close()
+        except Exception as inst:
+            print("DataManagement: Warning - data cache "+str(cache_file)+" could not be read: "+str(inst))
+            return False
+        self.__dict__.update( fields )
+        self.jrnd._seed, self.jrnd.nextNextGaussian = jrnd_state
+        if 'test' in datasets:
+            self.formatted_test_data = self.unpackData( datasets['test'] )
+        self.formatted_train_data = self.unpackData( datasets['train'] )
+        print("DataManagement: Number of Attributes = " + str(self.numb_attributes))
+        if cons.kfold_cv == False:
+            print("DataManagement: Number of Instances = " + str(self.numb_train_instances))
+        return True
+
+    def packData(self, formatted):
+        """ Returns the formatted instances as typed arrays, one per attribute, with a mask of the missing states of the attributes that have some.
+        Instances held in memory as binary records are already packed. """
+        if isinstance( formatted, RecordInstances ):
+            return formatted
+        states = list( zip( *[ instance[0] for instance in formatted ] ) ) or [ () ] * self.numb_attributes
+        columns = []
+        for attributeID in range(self.numb_attributes):
+            values = states[attributeID]
+            missing = None
+            if cons.missing_label in values:
+                missing = bytes( value == cons.missing_label for value in values )
+                values = [ 0 if value == cons.missing_label else value for value in values ]
+            columns.append( ( array( 'd' if self.attribute_info[attributeID][0] else 'q', values ), missing ) )
+        phenotypes = array( 'q' if self.discrete_action else 'd', [ instance[1] for instance in formatted ] )
+        instanceIDs = None
+        if self.are_instanceIDs:
+            instanceIDs = array( 'q', [ instance[2] for instance in formatted ] )
+        return columns, phenotypes, instanceIDs
+
+    def unpackData(self, packed):
+        """ Rebuilds the formatted instances packed by packData. """
+        if isinstance( packed, RecordInstances ):
+            return packed
+        columns, phenotypes, instanceIDs = packed
+        states = []
+        for values, missing in columns:
+            values = values.tolist()
+            if missing != None:
+                for inst in [ inst for inst in range(len(missing)) if missing[inst] ]:
+                    values[inst] = cons.missing_label
+            states.append( values )
+        if instanceIDs == None:
+            instanceIDs = [None] * len(phenotypes)
+        else:
+            instanceIDs = instanceIDs.tolist()
+        return [ [ list(state_list), phenotype, instanceID ] for state_list, phenotype, instanceID in zip( zip(*states), phenotypes.tolist(), instanceIDs ) ]
+
     def shuffleTrainingData(self):
         """ shuffling data. """
-        random.shuffle( self.formatted_train_data )
+        random.shuffle( permutation(self.formatted_train_data) )
 
     def splitFolds(self, kfold=10):
-        """ divide data set into kfold sets. """
-        self.formatted_train_data = stratify( self.formatted_train_data, kfold )
-        data_size = len( self.formatted_train_data )
-        self.folds = [ [] for _ in range(kfold) ]
+        """ divide data set into kfold sets, kept as arrays of positions in the training data rather than copies of the instances. """
+        self.fold_data = self.formatted_train_data    # Instances the fold positions refer to
+        stratified_positions = stratify( self.fold_data, kfold, positions=True )
+        data_size = len( stratified_positions )
+        self.folds = [ None ] * kfold
         for fold_id in range(kfold):
             fold_size = int( data_size/kfold )
             if fold_id < data_size % kfold:
@@ -326,27 +414,35 @@ class DataManagement:
             else:
                 offset = data_size % kfold
             first = fold_id * ( int( data_size/kfold ) ) + offset
-            self.folds[fold_id] = self.formatted_train_data[ first : ( first+fold_size ) ]
+            self.folds[fold_id] = stratified_positions[ first : ( first+fold_size ) ]
+
+    def foldData(self, fold_ids):
+        """ Returns the instances of the given folds, one fold after the other, stored as the training data is. """
+        positions = array( 'q' )
+        for fold_id in fold_ids:
+            positions.extend( self.folds[fold_id] )
+        return reorder( self.fold_data, positions )
 
     def splitData(self):
         """ divide data set into kfold sets. """
+        phenotypes = phenotypesOf( self.formatted_train_data )
         class_counts = [0] * len( self.action_list )
-        for instance in self.formatted_train_data:
-            class_counts[ self.action_list.index( instance[1] ) ] += 1
+        for phenotype in phenotypes:
+            class_counts[ self.action_list.index( phenotype ) ] += 1
         training_sizes_for_actions = [0] * len( self.action_list )
         for i in range( len(self.action_list) ):
             training_sizes_for_actions[i] = int( class_counts[i] * cons.training_portion + 0.5 )
         numb_instances_for_actions = [0] * len(self.action_list)
-        train_data = []
-        test_data = []
-        for instance in self.formatted_train_data:
-            action_index = self.action_list.index( instance[1] )
+        train_positions = []
+        test_positions = []
+        for position in range( len(phenotypes) ):
+            action_index = self.action_list.index( phenotypes[position] )
             if numb_instances_for_actions[action_index] < training_sizes_for_actions[action_index]:
-                train_data.append(instance)
+                train_positions.append(position)
                 numb_instances_for_actions[action_index] += 1
             else:
-                test_data.append(instance)
-        return train_data, test_data
+                test_positions.append(position)
+        return reorder( self.formatted_train_data, train_positions ), reorder( self.formatted_train_data, test_positions )
 
     def splitData2(self):
         """ divide data set into kfold sets. """
@@ -355,15 +451,10 @@ class DataManagement:
             train_data, test_data = self.splitData()
         else:
             self.splitFolds( cons.kfold )
-            train_data = []
-            test_data = []
-            for i in range( cons.kfold ):
-                if i < num_train_folds:
-                    train_data += self.folds[i]
-                else:
-                    test_data += self.folds[i]
+            train_data = self.foldData( [ i for i in range( cons.kfold ) if i < num_train_folds ] )
+            test_data = self.foldData( [ i for i in range( cons.kfold ) if not i < num_train_folds ] )
         self.formatted_train_data = train_data
-        random.shuffle( self.formatted_train_data )
+        random.shuffle( permutation(self.formatted_train_data) )
         self.formatted_test_data = test_data
         self.numb_train_instances = len( self.formatted_train_data )
         self.numb_test_instances = len( self.formatted_test_data )
@@ -372,44 +463,153 @@ class DataManagement:
 
     def selectTrainTestSets(self, fold_id):
         """ select one fold for testing and the rest for training (k-fold cross validation. """
-        self.formatted_train_data = []
-        for i in range( cons.kfold ):
-            if i != fold_id:
-                self.formatted_train_data += self.folds[i]
-        randomize( self.formatted_train_data, self.jrnd )
-        self.formatted_test_data = self.folds[fold_id]
+        self.formatted_train_data = self.foldData( [ i for i in range( cons.kfold ) if i != fold_id ] )
+        randomize( permutation(self.formatted_train_data), self.jrnd )
+        self.formatted_test_data = self.foldData( [ fold_id ] )
         self.numb_train_instances = len(self.formatted_train_data)
         self.numb_test_instances = len(self.formatted_test_data)
         print("DataManagement: Number of Instances = " + str(self.numb_train_instances))
         print("DataManagement: Number of Instances = " + str(self.numb_test_instances))
 
 
-def stratify(all_data, kfold=10):
-    """ divide data set into kfold sets. """
-    # sort by class
-    index = 1
-    numb_instances = len(all_data)
-    while index < numb_instances:
-        instance1 = all_data[index - 1]
-        for j in range( index, numb_instances ):
-            instance2 = all_data[j]
-            if instance1[1] == instance2[1]:
-                #swap(index, j)
-                temp = all_data[index]
-                all_data[index] = all_data[j]
-                all_data[j] = temp
-                index += 1
-        index += 1
+class ColumnProfile:
+    def __init__(self, limit):
+        """ Summary of the values of one data column, built chunk by chunk while the file is read. The rows of each distinct value are counted, in order of
+        first appearance, until more than limit distinct values (None: no limit) have been met; from then on only the range of the values is kept. """
+        self.limit = limit
+        self.counts = Counter()      # Rows of each distinct value (missing label included), in order of first appearance; None once past the limit
+        self.exceeding = None        # First value beyond the limit
+        self.missing_before = 0      # Missing values before the first value beyond the limit (in the whole column while within the limit)
+        self.value_range = None      # [min, max] of the values as floats once past the limit, starting from the first value beyond the limit
+
+    def update(self, values):
+        """ Adds the next values of the column, in row order. """
+        if self.counts == None:
+            self.value_range = extendRange( self.value_range, values )
+            return
+        missing = self.counts[cons.missing_label]
+        self.counts.update( values )
+        states = self.states()
+        if self.limit == None or len(states) <= self.limit:
+            self.missing_before = self.counts[cons.missing_label]
+            return
+        self.exceeding = states[self.limit]
+        self.missing_before = missing + values[ :values.index( self.exceeding ) ].count( cons.missing_label )
+        self.value_range = extendRange( [ float(self.exceeding), float(self.exceeding) ], states )
+        self.counts = None
+
+    def states(self):
+        """ Returns the distinct non-missing values met so far, in order of first appearance (while within the limit). """
+        return [ value for value in self.counts if value != cons.missing_label ]
+
+    def widenRange(self, value_range):
+        """ Widens value_range ([min, max]) in place to the values of the column. """
+        if self.counts == None:
+            column_range = self.value_range
+        else:
+            column_range = extendRange( None, self.states() )
+        if column_range != None:
+            extendRange( value_range, column_range )
+
+
+def extendRange(value_range, values):
+    """ Widens value_range ([min, max], or None) to the non-missing values, in order, with strict comparisons as a scan over the rows would. """
+    for value in dict.fromkeys( values ):
+        if value == cons.missing_label:
+            continue
+        value = float( value )
+        if value_range == None:
+            value_range = [ value, value ]
+        elif value > value_range[1]:
+            value_range[1] = value
+        elif value < value_range[0]:
+            value_range[0] = value
+    return value_range
+
+
+def readChunks(data_file, numb_columns):
+    """ Yields the rows of an open data file, read past its header line, split into fields, CHUNK_ROWS lines at a time. Blank lines are skipped; a
+    row with another number of fields than numb_columns (the header) raises a ValueError giving its line number. """
+    line_numb = 2   # Line number of the first line of the chunk
+    while True:
+        lines = list( islice( data_file, CHUNK_ROWS ) )
+        if not lines:
+            return
+        rows = [ line.strip('\n').split('\t') for line in lines ]
+        if set( map( len, rows ) ) != { numb_columns }:
+            for position in range( len(rows) ):
+                if len( rows[position] ) != numb_columns and rows[position] != ['']:
+                    message = "line " + str( line_numb + position ) + " of " + str( data_file.name ) + " has " + str( len( rows[position] ) ) + " fields, the header has " + str( numb_columns )
+                    print("DataManagement: Error - " + message + ".")
+                    raise ValueError( message )
+            rows = [ row for row in rows if row != [''] ]
+        line_numb += len(lines)
+        if rows:
+            yield rows
+
+
+def formatColumn(values, convert):
+    """ Converts the values of a column, leaving missing data as the text label. """
+    if cons.missing_label in values:
+        return [ value if value == cons.missing_label else convert(value) for value in values ]
+    return list( map( convert, values ) )
+
+
+def cacheKey(train_file, test_file):
+    """ Returns the key of the data cache: the size and modification time of the data files and the settings used to format them. """
+    stamps = []
+    for dat_file in ( train_file, test_file ):
+        if dat_file != 'None':
+            info = os.stat( dat_file )
+            stamps.append( ( info.st_size, info.st_mtime_ns ) )
+    return ( CACHE_VERSION, tuple(stamps), cons.test_file != 'None', cons.ID_label, cons.class_label, cons.missing_label, cons.discrete_attribute_limit, cons.data_storage )
+
+
+def dataDigest(train_file, test_file):
+    """ Returns the SHA-256 digest of the content of the data files. """
+    digest = hashlib.sha256()
+    for dat_file in ( train_file, test_file ):
+        if dat_file == 'None':
+            continue
+        f = open( dat_file, 'rb' )
+        block = f.read( 1 << 20 )
+        while block:
+            digest.update( block )
+            block = f.read( 1 << 20 )
+        f.close()
+        digest.update( b'\0' )
+    return digest.hexdigest()
+
+
+def stratify(all_data, kfold=10, positions=False):
+    """ divide data set into kfold sets. Instances are grouped by class, in the order the former in-place swap loop left them, and dealt round-robin
+    into kfold trunks. Returns the stratified instances, or with positions=True an array of their positions in all_data. """
+    # sort by class: one pass per class, as the swap loop took instances of the class to the front of the rest. The instances of other classes
+    # then behaved as a queue, whose front instance was swapped to the back each time an instance of the class was taken after it.
+    phenotypes = phenotypesOf( all_data )
+    numb_instances = len(phenotypes)
+    order = []
+    remaining = deque( range( numb_instances ) )
+    while remaining:
+        first = remaining.popleft()
+        order.append( first )
+        phenotype1 = phenotypes[first]
+        others = deque()
+        for position in remaining:
+            if phenotypes[position] == phenotype1:
+                order.append( position )
+                if others:
+                    others.rotate( -1 )
+            else:
+                others.append( position )
+        remaining = others
     # rearrange classes to kfold trunks.
-    stratified_data = []
-    start = 0
-    while len(stratified_data) < numb_instances:
-        j = start
-        while j < numb_instances:
-            stratified_data.append( all_data[j] )
-            j += kfold
-        start += 1
-    return stratified_data
+    stratified_positions = array( 'q' )
+    for start in range( kfold ):
+        stratified_positions.extend( order[ start::kfold ] )
+    if positions:
+        return stratified_positions
+    return reorder( all_data, stratified_positions )
 
 
 def randomize( formatted_data, javarandom ):
@@ -419,3 +619,24 @@ def randomize( formatted_data, javarandom ):
         j = javarandom.nextInt(i + 1)
         formatted_data[i] = formatted_data[j]
         formatted_data[j] = temp
+
+
+def permutation(data):
+    """ Returns the sequence permuted when data is shuffled: the index of instances held as records, or the list of instances itself. """
+    if isinstance( data, RecordInstances ):
+        return data.index
+    return data
+
+
+def phenotypesOf(data):
+    """ Returns the list of phenotypes of the instances in data, in order. """
+    if isinstance( data, RecordInstances ):
+        return data.phenotypes()
+    return [ instance[1] for instance in data ]
+
+
+def reorder(data, positions):
+    """ Returns the instances of data at the given positions, in that order, stored as data is. """
+    if isinstance( data, RecordInstances ):
+        return data.reordered( positions )
+    return [ data[position] for position in positions ]
@@ -0,0 +1,295 @@
+"""
+Name:        xcs_deletion.py
+Authors:     Bao Trung
+Contact:     baotrung@ecs.vuw.ac.nz
+Created:     October, 2026
+Description:
+---------------------------------------------------------------------------------------------------------------------------------------------------------
+XCS: Michigan-style Learning Classifier System - A LCS for Reinforcement Learning.  This XCS follows the version descibed in "An Algorithmic Description of XCS" published by Martin Butz and Stewart Wilson (2002).
+Deletion schemes used by the ClassifierSet to choose the micro-classifier removed when the population exceeds N. Both schemes select a rule by
+roulette wheel over the deletion votes of Classifier.getDelProb, in population order.
+---------------------------------------------------------------------------------------------------------------------------------------------------------
+"""
+
+#Import Required Modules---------------
+from bisect import bisect_left, insort
+from xcs_constants import *
+try:
+    import numpy as np
+except ImportError:
+    np = None
+#import crandom as random
+import random
+#--------------------------------------
+
+def buildDeletion(population):
+    """ Returns the deletion scheme selected by cons.deletion_method for the given ClassifierSet. """
+    if cons.deletion_method == 'sumtree':
+        return VoteTree( population )
+    if cons.deletion_method != 'roulette':
+        print("Deletion: Warning - unknown deletion method '"+str(cons.deletion_method)+"', roulette deletion used instead.")
+    return RouletteDeletion( population )
+
+
+class RouletteDeletion:
+    def __init__(self, population):
+        """ Recomputes the deletion vote of every rule for each deletion and scans the wheel linearly. """
+        self.population = population
+
+    def addClassifier(self, cl):
+        """ Called when a new macro-classifier is appended to the population. """
+        return
+
+    def removeClassifier(self, cl):
+        """ Called when a macro-classifier is removed from the population. """
+        return
+
+    def updateClassifier(self, cl):
+        """ Called when the fitness, numerosity, action set size estimate or experience of a rule in the population has changed. """
+        return
+
+    def selectDeletion(self):
+        """ Returns the rule chosen for deletion by roulette wheel selection over the deletion votes. """
+        if self.population.store != None:
+            return self.selectDeletionFromStore()
+        pop_set = list(self.population.pop_set)
+        mean_fitness = self.population.getPopFitnessSum()/float(self.population.micro_size)
+        #Calculate total wheel size------------------------------
+        set_size = len(pop_set)
+        vote_sum = 0.0
+        vote_list = [0.0] * set_size
+        for i in range(set_size):
+            cl = pop_set[i]
+            vote = cl.getDelProb(mean_fitness)
+            vote_sum += vote
+            vote_list[i] = vote
+        #--------------------------------------------------------
+        choice_point = vote_sum * random.random() #Determine the choice point
+        new_sum = 0.0
+        for i in range(len(vote_list)):
+            new_sum = new_sum + vote_list[i]
+            if new_sum > choice_point: #Select classifier for deletion
+                return pop_set[i]
+        return None
+
+    def selectDeletionFromStore(self):
+        """ Same selection with the votes computed as array operations over the columnar parameter store, with the same floating point operations as
+        Classifier.getDelProb and a cumulative (left to right) wheel. """
+        store = self.population.store
+        slots = store.activeSlots()
+        mean_fitness = self.population.getPopFitnessSum()/float(self.population.micro_size)
+        numerosity = store.column('numerosity')[slots]
+        fitness = store.column('fitness')[slots]
+        votes = store.column('avg_actionset_size')[slots] * numerosity
+        penalised = ( store.column('action_cnt')[slots] > cons.theta_del ) & ( fitness / numerosity < cons.delta*mean_fitness )
+        divisor = np.where( fitness != 0.0, fitness, cons.init_fit )
+        votes = np.where( penalised, votes * ( mean_fitness * numerosity / divisor ), votes )
+        store.column('delete_vote')[slots] = votes
+        if len(votes) == 0:
+            return None
+        wheel = np.cumsum( votes )
+        choice_point = float( wheel[-1] ) * random.random() #Determine the choice point
+        i = int( np.searchsorted( wheel, choice_point, side='right' ) )
+        if i == len(wheel):
+            return None
+        return store.rules[ slots[i] ]
+
+
+class VoteTree( RouletteDeletion ):
+    def __init__(self, population):
+        """ Keeps the deletion votes in a sum tree over population slots, so that a rule is selected in O(log N). The vote of a rule is split into a
+        constant part and a part proportional to the mean fitness of the population: a rule is penalised (vote proportional to the mean fitness) when it
+        is experienced enough and its fitness per micro-classifier is below delta times the mean fitness. Experienced rules are kept sorted by fitness per
+        micro-classifier (see SortedKeys), so only the rules crossing the threshold when the mean fitness moves are updated. Sums are taken in a different order than the
+        linear scan, so rounding (and hence seeded runs) can differ from roulette deletion. """
+        super().__init__( population )
+        self.reset( 64 )
+
+    def reset(self, capacity):
+        """ Empties the tree and makes room for capacity slots (a power of two). """
+        self.capacity = capacity
+        self.constant = [0.0] * ( 2 * capacity )     # Sum tree of the constant part of the votes
+        self.scaled = [0.0] * ( 2 * capacity )       # Sum tree of the part of the votes multiplied by the mean fitness
+        self.fitness = [0.0] * ( 2 * capacity )      # Sum tree of the fitnesses, its root gives the population fitness sum
+        self.rules = [None] * capacity               # Rule held in each slot, slots follow the population order
+        self.keys = [None] * capacity                # Entry of each experienced rule in self.ratios
+        self.penalised = [False] * capacity
+        self.ratios = SortedKeys()                   # (fitness per micro-classifier, slot) of the experienced rules
+        self.threshold = ( float('-inf'), )          # Entries of self.ratios below this key are penalised
+        self.slots = {}                              # Slot of each rule in the population
+        self.dirty = {}                              # Rules whose parameters changed since the last deletion
+        self.top = 0                                 # Number of slots used so far, removed rules leave their slot empty
+
+    def addClassifier(self, cl):
+        """ Gives the new rule the next slot, compacting the tree when it is full. """
+        if self.top == self.capacity:
+            self.rebuild()
+        self.rules[self.top] = cl
+        self.slots[cl] = self.top
+        self.top += 1
+        self.dirty[cl] = None
+
+    def removeClassifier(self, cl):
+        """ Empties the slot of the removed rule. """
+        slot = self.slots.pop( cl )
+        self.dirty.pop( cl, None )
+        self.removeKey( slot )
+        self.rules[slot] = None
+        self.setLeaf( self.fitness, slot, 0.0 )
+        self.setVote( slot, 0.0, 0.0 )
+
+    def updateClassifier(self, cl):
+        """ Marks the rule to be brought up to date before the next deletion. """
+        if cl in self.slots:
+            self.dirty[cl] = None
+
+    def rebuild(self):
+        """ Moves the rules to the first slots, in population order, in a tree with room for as many rules again. """
+        rules = [ cl for cl in self.rules[ :self.top ] if cl != None ]
+        capacity = 64
+        while capacity < 2 * len(rules):
+            capacity *= 2
+        self.reset( capacity )
+        for slot in range( len(rules) ):
+            self.rules[slot] = rules[slot]
+            self.slots[ rules[slot] ] = slot
+            self.dirty[ rules[slot] ] = None
+        self.top = len(rules)
+
+    def selectDeletion(self):
+        """ Returns the rule chosen for deletion by roulette wheel selection over the deletion votes. """
+        mean_fitness = self.refresh()
+        choice_point = ( self.constant[1] + mean_fitness * self.scaled[1] ) * random.random() #Determine the choice point
+        node = 1
+        while node < self.capacity:
+            left_vote = self.constant[ 2*node ] + mean_fitness * self.scaled[ 2*node ]
+            if left_vote > choice_point:
+                node = 2 * node
+            else:
+                choice_point -= left_vote
+                node = 2 * node + 1
+        slot = node - self.capacity
+        #Rounding may end the descent past the last vote, take the closest rule with a vote on the left.
+        while slot >= 0 and ( self.rules[slot] == None or self.constant[ self.capacity+slot ] + self.scaled[ self.capacity+slot ] == 0.0 ):
+            slot -= 1
+        if slot < 0:
+            return None
+        return self.rules[slot]
+
+    def refresh(self):
+        """ Brings the changed rules and the penalised set up to date with the current mean fitness, which is returned. """
+        changed = []
+        for cl in self.dirty:
+            slot = self.slots[cl]
+            self.removeKey( slot )
+            self.setLeaf( self.fitness, slot, cl.fitness )
+            if cl.action_cnt > cons.theta_del:
+                key = ( cl.fitness / cl.numerosity, slot )
+                self.ratios.add( key )
+                self.keys[slot] = key
+                self.penalised[slot] = key < self.threshold
+            else:
+                self.penalised[slot] = False
+            changed.append( slot )
+        self.dirty = {}
+        mean_fitness = self.fitness[1] / float( self.population.micro_size )
+        #Move the boundary of the penalised rules to the new threshold---------
+        threshold = ( cons.delta * mean_fitness, )
+        for key in self.ratios.between( min( threshold, self.threshold ), max( threshold, self.threshold ) ):
+            self.penalised[ key[1] ] = key < threshold
+            changed.append( key[1] )
+        self.threshold = threshold
+        #Recompute the votes of the changed rules-----------------------------
+        for slot in changed:
+            cl = self.rules[slot]
+            vote = cl.avg_actionset_size * cl.numerosity
+            if self.penalised[slot]:
+                if cl.fitness != 0.0:
+                    vote *= cl.numerosity / cl.fitness
+                else:
+                    vote *= cl.numerosity / cons.init_fit
+                self.setVote( slot, 0.0, vote )
+                cl.delete_vote = vote * mean_fitness
+            else:
+                self.setVote( slot, vote, 0.0 )
+                cl.delete_vote = vote
+        return mean_fitness
+
+    def removeKey(self, slot):
+        """ Takes the rule in slot out of the sorted experienced rules. """
+        key = self.keys[slot]
+        if key != None:
+            self.ratios.remove( key )
+            self.keys[slot] = None
+            self.penalised[slot] = False
+
+    def setVote(self, slot, constant, scaled):
+        """ Sets both parts of the vote of the rule in slot. """
+        self.setLeaf( self.constant, slot, constant )
+        self.setLeaf( self.scaled, slot, scaled )
+
+    def setLeaf(self, tree, slot, value):
+        """ Sets a leaf of a sum tree and recomputes the sums above it. """
+        node = self.capacity + slot
+        tree[node] = value
+        node //= 2
+        while node >= 1:
+            tree[node] = tree[ 2*node ] + tree[ 2*node+1 ]
+            node //= 2
+
+
+class SortedKeys:
+    LOAD = 256
+
+    def __init__(self):
+        """ Sorted collection of distinct keys held in consecutive buckets of at most 2*LOAD keys, with the last key of every bucket indexed. A key
+        is located by two bisections and inserted or removed by moving at most 2*LOAD references, instead of shifting a list of all N keys. Splitting
+        or dropping a bucket shifts the N/LOAD bucket references. """
+        self.buckets = []        # Sorted lists of keys, each one after the previous
+        self.maxes = []          # Last key of each bucket
+
+    def add(self, key):
+        """ Inserts the key. """
+        if not self.buckets:
+            self.buckets.append( [key] )
+            self.maxes.append( key )
+            return
+        index = bisect_left( self.maxes, key )
+        if index == len( self.maxes ):
+            index -= 1
+            self.buckets[index].append( key )
+            self.maxes[index] = key
+        else:
+            insort( self.buckets[index], key )
+        bucket = self.buckets[index]
+        if len( bucket ) > 2 * self.LOAD:
+            self.buckets.insert( index + 1, bucket[ self.LOAD: ] )
+            del bucket[ self.LOAD: ]
+            self.maxes.insert( index, bucket[-1] )
+
+    def remove(self, key):
+        """ Removes the key, which must be present. """
+        index = bisect_left( self.maxes, key )
+        bucket = self.buckets[index]
+        del bucket[ bisect_left( bucket, key ) ]
+        if not bucket:
+            del self.buckets[index]
+            del self.maxes[index]
+        elif self.maxes[index] == key:
+            self.maxes[index] = bucket[-1]
+
+    def between(self, low, high):
+        """ Iterates in order over the keys from low (included) to high (excluded). """
+        index = bisect_left( self.maxes, low )
+        if index == len( self.maxes ):
+            return
+        position = bisect_left( self.buckets[index], low )
+        while index < len( self.buckets ):
+            bucket = self.buckets[index]
+            while position < len( bucket ):
+                if not bucket[position] < high:
+                    return
+                yield bucket[position]
+                position += 1
+            index += 1
+            position = 0
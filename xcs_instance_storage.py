@@ -0,0 +1,166 @@
+"""
+Name:        xcs_instance_storage.py
+Authors:     Bao Trung
+Contact:     baotrung@ecs.vuw.ac.nz
+Created:     October, 2026
+Description:
+---------------------------------------------------------------------------------------------------------------------------------------------------------
+XCS: Michigan-style Learning Classifier System - A LCS for Reinforcement Learning.  This XCS follows the version descibed in "An Algorithmic Description of XCS" published by Martin Butz and Stewart Wilson (2002).
+Storage of the formatted data instances outside of Python lists (cons.data_storage). The instances are written once as fixed-width binary records,
+either in memory ('arrays') or in a memory-mapped file ('mapped'), and a dataset is a view of the records through an index of record numbers.
+Discrete states are stored in the narrowest integer type holding every state of their attribute, continuous states as doubles, and missing states
+in a bitmask. Shuffling and splitting a dataset only permute its index; an instance is decoded into the usual lists when it is accessed.
+---------------------------------------------------------------------------------------------------------------------------------------------------------
+"""
+
+#Import Required Modules---------------
+from array import array
+import mmap
+import struct
+import tempfile
+from xcs_constants import cons
+#--------------------------------------
+
+INTEGER_FORMATS = ( ( 'B', 0, 255 ), ( 'b', -128, 127 ), ( 'H', 0, 65535 ), ( 'h', -32768, 32767 ), ( 'i', -2**31, 2**31-1 ) )
+
+
+def integerFormat(values):
+    """ Returns the struct format of the narrowest integer type holding all the values. """
+    if len(values) == 0:
+        return 'B'
+    low = min( values )
+    high = max( values )
+    for code, minimum, maximum in INTEGER_FORMATS:
+        if minimum <= low and high <= maximum:
+            return code
+    return 'q'
+
+
+class RecordStore:
+    def __init__(self, attribute_info, discrete_action, are_instanceIDs, mapped=False):
+        """ Fixed-width records of formatted instances: the attribute states, the phenotype, the instance ID (if any) and a bitmask of the missing
+        states. Records are kept in memory, or in an anonymous file (deleted when closed) created in the default temporary directory (TMPDIR) and
+        memory-mapped for reading. """
+        self.numb_attributes = len( attribute_info )
+        self.are_instanceIDs = are_instanceIDs
+        formats = []
+        for info in attribute_info:
+            if info[0]: #Continuous attribute
+                formats.append( 'd' )
+            else:
+                formats.append( integerFormat( [ int(state) for state in info[1] ] ) )
+        formats.append( 'q' if discrete_action else 'd' )      # Phenotype (testing data may hold classes unseen in training)
+        if are_instanceIDs:
+            formats.append( 'q' )
+        self.mask_size = ( self.numb_attributes + 7 ) // 8
+        self.format = '<' + ''.join( formats ) + str( self.mask_size ) + 's'
+        self.phenotype_format = '<' + formats[ self.numb_attributes ]
+        self.phenotype_offset = struct.calcsize( '<' + ''.join( formats[ :self.numb_attributes ] ) )
+        self.setStructs()
+        if mapped:
+            self.file = tempfile.TemporaryFile()
+            self.buffer = None
+        else:
+            self.file = None
+            self.buffer = bytearray()
+        self.numb_records = 0
+
+    def setStructs(self):
+        """ Compiles the record formats. """
+        self.record = struct.Struct( self.format )
+        self.phenotype = struct.Struct( self.phenotype_format )
+
+    def write(self, instances):
+        """ Appends the instances ([Attribute States, Phenotype, InstanceID], missing states as the text label) to the records. """
+        records = []
+        for state_list, phenotype, instanceID in instances:
+            mask = 0
+            if cons.missing_label in state_list:
+                state_list = list( state_list )
+                for attributeID in range( self.numb_attributes ):
+                    if state_list[attributeID] == cons.missing_label:
+                        state_list[attributeID] = 0
+                        mask |= 1 << attributeID
+            if self.are_instanceIDs:
+                records.append( self.record.pack( *state_list, phenotype, instanceID, mask.to_bytes( self.mask_size, 'little' ) ) )
+            else:
+                records.append( self.record.pack( *state_list, phenotype, mask.to_bytes( self.mask_size, 'little' ) ) )
+        if self.file == None:
+            self.buffer += b''.join( records )
+        else:
+            self.file.write( b''.join( records ) )
+        self.numb_records += len( records )
+
+    def finishWriting(self):
+        """ Makes the written records readable. A file is mapped in memory, with read-ahead turned off where supported as records are read in
+        shuffled order. """
+        if self.file == None:
+            return
+        self.file.flush()
+        if self.numb_records > 0:
+            self.buffer = mmap.mmap( self.file.fileno(), 0, access=mmap.ACCESS_READ )
+            if hasattr( self.buffer, 'madvise' ) and hasattr( mmap, 'MADV_RANDOM' ):
+                self.buffer.madvise( mmap.MADV_RANDOM )
+
+    def read(self, record):
+        """ Returns the instance in the given record as [Attribute States, Phenotype, InstanceID]. """
+        values = self.record.unpack_from( self.buffer, record * self.record.size )
+        state_list = list( values[ :self.numb_attributes ] )
+        mask = values[-1]
+        if mask.strip( b'\0' ):
+            mask = int.from_bytes( mask, 'little' )
+            for attributeID in range( self.numb_attributes ):
+                if mask >> attributeID & 1:
+                    state_list[attributeID] = cons.missing_label
+        if self.are_instanceIDs:
+            return [ state_list, values[-3], values[-2] ]
+        return [ state_list, values[-2], None ]
+
+    def phenotypes(self, records):
+        """ Returns the phenotypes of the given records, reading only the phenotype field. """
+        size = self.record.size
+        offset = self.phenotype_offset
+        unpack = self.phenotype.unpack_from
+        return [ unpack( self.buffer, record * size + offset )[0] for record in records ]
+
+    def __getstate__(self):
+        """ Records kept in memory are pickled (for the data cache) without the compiled formats; mapped records are not picklable. """
+        if self.file != None:
+            raise TypeError( "RecordStore: mapped records cannot be pickled" )
+        state = dict( self.__dict__ )
+        del state['record']
+        del state['phenotype']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update( state )
+        self.setStructs()
+
+
+class RecordInstances:
+    def __init__(self, records, index):
+        """ A dataset held in a RecordStore: the instance at position i is in record index[i]. Supports len, indexing, slicing and iteration like the
+        list of formatted instances it replaces; reordering is done on the index (see xcs_data_management). """
+        self.records = records
+        self.index = index       # array('q') of record numbers
+
+    def __len__(self):
+        return len( self.index )
+
+    def __getitem__(self, position):
+        if isinstance( position, slice ):
+            return RecordInstances( self.records, self.index[position] )
+        return self.records.read( self.index[position] )
+
+    def __iter__(self):
+        for record in self.index:
+            yield self.records.read( record )
+
+    def phenotypes(self):
+        """ Returns the phenotypes of the instances, in order. """
+        return self.records.phenotypes( self.index )
+
+    def reordered(self, positions):
+        """ Returns the dataset made of the instances at the given positions, in that order. """
+        index = self.index
+        return RecordInstances( self.records, array( 'q', [ index[position] for position in positions ] ) )
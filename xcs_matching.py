@@ -0,0 +1,395 @@
+"""
+Name:        xcs_matching.py
+Authors:     Bao Trung
+Contact:     baotrung@ecs.vuw.ac.nz
+Created:     October, 2026
+Description:
+---------------------------------------------------------------------------------------------------------------------------------------------------------
+XCS: Michigan-style Learning Classifier System - A LCS for Reinforcement Learning.  This XCS follows the version descibed in "An Algorithmic Description of XCS" published by Martin Butz and Stewart Wilson (2002).
+Matching engines used by the ClassifierSet to build match sets. Every engine returns the matching rules in population order, so that the
+resulting match set is identical to the one obtained by calling Classifier.match on every rule.
+---------------------------------------------------------------------------------------------------------------------------------------------------------
+"""
+
+#Import Required Modules---------------
+from multiprocessing import Pipe, Process, cpu_count
+from xcs_constants import *
+try:
+    import numpy as np
+except ImportError:
+    np = None
+#--------------------------------------
+
+MATRIX_AUTO_CELLS = 1 << 20     # Largest condition matrix (N rules by attributes) for which 'auto' picks matrix matching
+
+def buildMatcher(population):
+    """ Returns the matching engine selected by cons.matching_method for the given ClassifierSet. """
+    method = cons.matching_method
+    if method == 'auto':
+        if cons.env.format_data.binary_attributes:
+            method = 'bitmask'
+        elif np != None and cons.N * cons.env.format_data.numb_attributes <= MATRIX_AUTO_CELLS:
+            method = 'matrix'
+        else:
+            method = 'index'
+    if method == 'bitmask' and not cons.env.format_data.binary_attributes:
+        print("Matching: Warning - bitmask matching requires binary attributes, serial matching used instead.")
+        method = 'serial'
+    if method == 'matrix' and np == None:
+        print("Matching: Warning - matrix matching requires NumPy, serial matching used instead.")
+        method = 'serial'
+    if cons.multiprocessing:
+        matcher = ShardedMatcher( population, method == 'bitmask' )
+    else:
+        options = { 'serial':SerialMatcher,
+                    'bitmask':BitmaskMatcher,
+                    'matrix':MatrixMatcher,
+                    'index':IndexMatcher }
+        matcher = options[ method ]( population )
+    if cons.match_set_cache and not cons.online_data_generator:
+        if cons.env.format_data.record_storage:
+            print("Matching: Warning - the match set cache needs the instances kept in lists, no cache used with record data storage.")
+        else:
+            matcher = CachedMatcher( population, matcher )
+    return matcher
+
+
+class SerialMatcher:
+    def __init__(self, population):
+        """ Matches every rule in the population in turn. """
+        self.population = population
+
+    def addClassifier(self, cl):
+        """ Called when a new macro-classifier is appended to the population. """
+        return
+
+    def removeClassifier(self, cl):
+        """ Called when a macro-classifier is removed from the population. """
+        return
+
+    def matchSet(self, state):
+        """ Returns the list of rules in the population matching state, in population order. """
+        return [ cl for cl in self.population.pop_set if cl.match( state ) ]
+
+    def flush(self):
+        """ Applies the population changes the engine may still hold back, when match sets are served without calling matchSet. """
+        return
+
+    def close(self):
+        """ Releases the resources held by the engine. """
+        return
+
+
+class BitmaskMatcher( SerialMatcher ):
+    def __init__(self, population):
+        """ Matches rules through the packed care/value bitmasks every classifier keeps (see Classifier.packCondition). Only valid when every attribute is binary. """
+        super().__init__( population )
+
+    def matchSet(self, state):
+        """ Returns the list of rules in the population matching state, in population order. """
+        state_bits, present_bits = packState( state )
+        return [ cl for cl in self.population.pop_set if not ( state_bits ^ cl.value_mask ) & cl.care_mask & present_bits ]
+
+
+class MatrixMatcher( SerialMatcher ):
+    def __init__(self, population):
+        """ Keeps a dense NumPy matrix of rule conditions (one row per macro-classifier, NaN for '#') and finds the match set
+        with one broadcast comparison against the state vector. """
+        super().__init__( population )
+        self.numb_attributes = cons.env.format_data.numb_attributes
+        self.capacity = 0
+        self.conditions = np.empty( ( 0, self.numb_attributes ) )  # Condition values, NaN where the attribute is not specified
+        self.active = np.zeros( 0, dtype=bool )                    # Rows currently holding a rule
+        self.serials = np.zeros( 0, dtype=np.int64 )               # Insertion order of the rule held in each row, gives the population order back
+        self.rules = []                                            # Rule held in each row
+        self.free_rows = []                                        # Rows released by removed rules, reused first
+        self.rows = {}                                             # Row of each rule in the population
+        self.top = 0                                               # Number of rows in use or released
+        self.serial = 0
+
+    def addClassifier(self, cl):
+        """ Writes the condition of the new rule into a free row. """
+        if self.free_rows:
+            row = self.free_rows.pop()
+        else:
+            if self.top == self.capacity:
+                self.grow()
+            row = self.top
+            self.top += 1
+        self.conditions[row] = np.nan
+        for i in range( len(cl.condition) ):
+            self.conditions[ row, cl.specified_attributes[i] ] = float( cl.condition[i] )
+        self.active[row] = True
+        self.serials[row] = self.serial
+        self.serial += 1
+        self.rules[row] = cl
+        self.rows[cl] = row
+
+    def removeClassifier(self, cl):
+        """ Releases the row of the removed rule. """
+        row = self.rows.pop( cl )
+        self.active[row] = False
+        self.rules[row] = None
+        self.free_rows.append( row )
+
+    def grow(self):
+        """ Doubles the number of rows available. """
+        new_capacity = max( 64, 2 * self.capacity )
+        conditions = np.empty( ( new_capacity, self.numb_attributes ) )
+        conditions[ :self.capacity ] = self.conditions
+        self.conditions = conditions
+        active = np.zeros( new_capacity, dtype=bool )
+        active[ :self.capacity ] = self.active
+        self.active = active
+        serials = np.zeros( new_capacity, dtype=np.int64 )
+        serials[ :self.capacity ] = self.serials
+        self.serials = serials
+        self.rules += [None] * ( new_capacity - self.capacity )
+        self.capacity = new_capacity
+
+    def matchSet(self, state):
+        """ Returns the list of rules in the population matching state, in population order. """
+        conditions = self.conditions[ :self.top ]
+        missing = [ att for att in range( self.numb_attributes ) if state[att] == cons.missing_label ]
+        if missing:
+            state = [ np.nan if value == cons.missing_label else value for value in state ]
+        agree = np.isnan( conditions )
+        agree |= conditions == np.array( state, dtype=float )
+        if missing:
+            agree[ :, missing ] = True
+        rows = np.flatnonzero( agree.all( axis=1 ) & self.active[ :self.top ] )
+        rows = rows[ np.argsort( self.serials[rows] ) ]
+        return [ self.rules[row] for row in rows ]
+
+
+class IndexMatcher( SerialMatcher ):
+    def __init__(self, population):
+        """ Keeps an inverted index from (attribute, value) pairs to rules, where every rule is filed under each of its specified pairs. The rules
+        filed under a pair, and those specifying an attribute, are packed as bit sets over insertion serials. A rule matches when, on every
+        attribute the state holds, it either does not specify the attribute or is filed under the state's value, so the match set is the
+        intersection of those sets: a few big-integer operations per attribute, with no rule visited. The set bits come out in serial order,
+        which is the population order, so the result needs no sorting. """
+        super().__init__( population )
+        self.numb_attributes = cons.env.format_data.numb_attributes
+        self.resetIndex()
+
+    def resetIndex(self):
+        """ Empties the index. """
+        self.index = [ {} for _ in range( self.numb_attributes ) ]   # Per attribute: value -> bits of the rules filed under (attribute, value)
+        self.specified = [0] * self.numb_attributes                   # Per attribute: bits of the rules specifying it
+        self.live = 0            # Bits of the rules in the population
+        self.rules = {}          # Rule of each insertion serial, in serial order
+        self.serials = {}        # Insertion serial of each rule
+        self.serial = 0
+
+    def addClassifier(self, cl):
+        """ Files the new rule under each of its specified (attribute, value) pairs. """
+        if self.serial >= 2 * len( self.rules ) + 64:      # Serials of removed rules are only reclaimed by renumbering
+            rules = list( self.rules.values() )
+            self.resetIndex()
+            for rule in rules:
+                self.fileClassifier( rule )
+        self.fileClassifier( cl )
+
+    def fileClassifier(self, cl):
+        """ Gives the rule the next serial and sets its bit in the index. """
+        bit = 1 << self.serial
+        for i in range( len(cl.condition) ):
+            att = cl.specified_attributes[i]
+            values = self.index[att]
+            values[ cl.condition[i] ] = values.get( cl.condition[i], 0 ) | bit
+            self.specified[att] |= bit
+        self.live |= bit
+        self.rules[ self.serial ] = cl
+        self.serials[cl] = self.serial
+        self.serial += 1
+
+    def removeClassifier(self, cl):
+        """ Clears the bit of the rule in the index. """
+        serial = self.serials.pop( cl )
+        del self.rules[ serial ]
+        bit = 1 << serial
+        for i in range( len(cl.condition) ):
+            att = cl.specified_attributes[i]
+            values = self.index[att]
+            values[ cl.condition[i] ] ^= bit
+            if not values[ cl.condition[i] ]:
+                del values[ cl.condition[i] ]
+            self.specified[att] ^= bit
+        self.live ^= bit
+
+    def matchSet(self, state):
+        """ Returns the list of rules in the population matching state, in population order. """
+        matched = self.live
+        for att in range( self.numb_attributes ):
+            if self.specified[att] and state[att] != cons.missing_label:    # Missing attribute, no rule is eliminated on it
+                matched &= ~self.specified[att] | self.index[att].get( state[att], 0 )
+        bits = bin( matched )[:1:-1]       # Bit i at position i
+        rules = self.rules
+        serial = bits.find( '1' )
+        match_set = []
+        while serial != -1:
+            match_set.append( rules[serial] )
+            serial = bits.find( '1', serial + 1 )
+        return match_set
+
+
+class ShardedMatcher( SerialMatcher ):
+    def __init__(self, population, bitmask=False):
+        """ Splits the population between long-lived worker processes (used when multiprocessing is enabled). Each worker keeps its own shard
+        of rule conditions. Rule additions and removals are queued and shipped to the owning worker together with the next state, and only
+        the insertion serials of the matching rules come back, so neither classifiers nor the population are pickled on every iteration. """
+        super().__init__( population )
+        self.bitmask = bitmask
+        self.numb_workers = cpu_count()
+        self.connections = []
+        self.workers = []
+        for _ in range( self.numb_workers ):
+            parent_conn, child_conn = Pipe()
+            worker = Process( target=matchShard, args=( child_conn, cons.missing_label, bitmask ), daemon=True )
+            worker.start()
+            child_conn.close()
+            self.connections.append( parent_conn )
+            self.workers.append( worker )
+        self.shard_sizes = [0] * self.numb_workers
+        self.added = [ [] for _ in range( self.numb_workers ) ]    # Pending (serial, condition) additions per shard
+        self.removed = [ [] for _ in range( self.numb_workers ) ]  # Pending serial removals per shard
+        self.rules = {}          # Rule of each insertion serial
+        self.serials = {}        # Insertion serial and shard of each rule in the population
+        self.serial = 0
+
+    def addClassifier(self, cl):
+        """ Assigns the new rule to the smallest shard. """
+        shard = self.shard_sizes.index( min( self.shard_sizes ) )
+        self.shard_sizes[shard] += 1
+        if self.bitmask:
+            self.added[shard].append( ( self.serial, cl.care_mask, cl.value_mask ) )
+        else:
+            self.added[shard].append( ( self.serial, tuple( cl.specified_attributes ), tuple( cl.condition ) ) )
+        self.rules[ self.serial ] = cl
+        self.serials[cl] = ( self.serial, shard )
+        self.serial += 1
+
+    def removeClassifier(self, cl):
+        """ Queues the removal of the rule from its shard. """
+        serial, shard = self.serials.pop( cl )
+        del self.rules[ serial ]
+        self.shard_sizes[shard] -= 1
+        self.removed[shard].append( serial )
+
+    def matchSet(self, state):
+        """ Broadcasts state to every worker and merges the matching serials back into population order. """
+        if self.bitmask:
+            state = packState( state )
+        for shard in range( self.numb_workers ):
+            self.connections[shard].send( ( self.added[shard], self.removed[shard], state ) )
+            self.added[shard] = []
+            self.removed[shard] = []
+        matched = []
+        for conn in self.connections:
+            matched += conn.recv()
+        matched.sort()
+        return [ self.rules[serial] for serial in matched ]
+
+    def flush(self):
+        """ Ships the pending additions and removals to their workers without a state, no reply is awaited. """
+        for shard in range( self.numb_workers ):
+            if self.added[shard] or self.removed[shard]:
+                self.connections[shard].send( ( self.added[shard], self.removed[shard], None ) )
+                self.added[shard] = []
+                self.removed[shard] = []
+
+    def close(self):
+        """ Stops the workers. """
+        for conn in self.connections:
+            conn.send( None )
+            conn.close()
+        for worker in self.workers:
+            worker.join()
+        self.connections = []
+        self.workers = []
+
+
+class CachedMatcher( SerialMatcher ):
+    def __init__(self, population, matcher):
+        """ Caches the match set of every instance of an offline dataset, on top of another matching engine. Instances are identified by their
+        formatted state list, which stays the same object for the whole run. When an instance is seen again, rules removed since its last visit
+        are dropped from its cached match set and only the rules inserted since then are tested. """
+        super().__init__( population )
+        self.matcher = matcher
+        self.entries = {}        # id of instance state -> [state, matching rules in population order, first population slot not yet tested]
+
+    def addClassifier(self, cl):
+        """ Called when a new macro-classifier is appended to the population. """
+        self.matcher.addClassifier( cl )
+
+    def removeClassifier(self, cl):
+        """ Called when a macro-classifier is removed from the population, cached match sets drop it on their next use. """
+        self.matcher.removeClassifier( cl )
+
+    def matchSet(self, state):
+        """ Returns the list of rules in the population matching state, in population order. """
+        pop_set = self.population.pop_set
+        entry = self.entries.get( id(state) )
+        if entry == None:
+            matched = self.matcher.matchSet( state )
+            self.entries[ id(state) ] = [ state, matched, pop_set.next_slot ]     # Keeping state alive keeps its id unique
+            return matched[:]
+        self.matcher.flush()     # The wrapped engine is not called on a hit, its pending updates must not pile up
+        matched = [ cl for cl in entry[1] if cl in pop_set ]
+        for cl in pop_set.addedSince( entry[2] ):
+            if cl.match( state ):
+                matched.append( cl )
+        entry[1] = matched
+        entry[2] = pop_set.next_slot
+        return matched[:]
+
+    def close(self):
+        """ Releases the resources held by the underlying engine. """
+        self.matcher.close()
+
+
+def packState(state):
+    """ Packs a binary state into an integer of attribute values and an integer of non-missing attributes. """
+    state_bits = 0
+    present_bits = 0
+    for att in range( len(state) ):
+        if state[att] != cons.missing_label:
+            present_bits |= 1 << att
+            if state[att] == 1:
+                state_bits |= 1 << att
+    return state_bits, present_bits
+
+
+def matchShard(conn, missing_label, bitmask):
+    """ Worker loop of the ShardedMatcher: applies pending shard updates, then (unless no state was sent) returns the serials of the rules in the shard matching the state. """
+    shard = {}
+    while True:
+        message = conn.recv()
+        if message == None:
+            break
+        added, removed, state = message
+        for serial, first, second in added:
+            shard[serial] = ( first, second )
+        for serial in removed:        # May include rules added in this same batch
+            del shard[serial]
+        if state == None:             # Updates flushed without a state to match
+            continue
+        matched = []
+        if bitmask:
+            state_bits, present_bits = state
+            for serial, masks in shard.items():
+                if not ( state_bits ^ masks[1] ) & masks[0] & present_bits:
+                    matched.append( serial )
+        else:
+            for serial, rule in shard.items():
+                is_match = True
+                for i in range( len(rule[0]) ):
+                    state_val = state[ rule[0][i] ]
+                    if state_val != rule[1][i] and state_val != missing_label:
+                        is_match = False
+                        break
+                if is_match:
+                    matched.append( serial )
+        conn.send( matched )
+    conn.close()
@@ -26,8 +26,9 @@ class Offline_Environment:
 
     def getTrainInstance(self):
         """ Returns the current training instance. """
-        self.train_inst_condition = self.format_data.formatted_train_data[self.data_ref][0]
-        self.train_inst_phenotype = self.format_data.formatted_train_data[self.data_ref][1]
+        instance = self.format_data.formatted_train_data[self.data_ref]
+        self.train_inst_condition = instance[0]
+        self.train_inst_phenotype = instance[1]
         if self.data_ref < (self.format_data.numb_train_instances-1):
             self.data_ref += 1
         else:  #Once learning has completed an epoch (i.e. a cycle of iterations though the entire training dataset) it starts back at the first instance in the data)
@@ -38,8 +39,9 @@ class Offline_Environment:
 
     def getTestInstance(self):
         """ Returns the current training instance. """
-        self.test_inst_condition = self.format_data.formatted_test_data[self.data_ref][0]
-        self.test_inst_phenotype = self.format_data.formatted_test_data[self.data_ref][1]
+        instance = self.format_data.formatted_test_data[self.data_ref]
+        self.test_inst_condition = instance[0]
+        self.test_inst_phenotype = instance[1]
         if self.data_ref < (self.format_data.numb_test_instances-1):
             self.data_ref += 1
         else:
@@ -61,6 +61,7 @@ class DataGenerator:
         self.numb_test_instances = cons.tracking_frequency
         self.numb_attributes = sizes[ 0 ]
         self.attribute_info = [ [ 0, [] ] ] * sizes[ 0 ]
+        self.binary_attributes = True    # all generated problems are boolean
         self.discrete_action = True
         self.action_list = [ 0, 1 ]
 
@@ -0,0 +1,182 @@
+"""
+Name:        xcs_parameter_store.py
+Authors:     Bao Trung
+Contact:     baotrung@ecs.vuw.ac.nz
+Created:     October, 2026
+Description:
+---------------------------------------------------------------------------------------------------------------------------------------------------------
+XCS: Michigan-style Learning Classifier System - A LCS for Reinforcement Learning.  This XCS follows the version descibed in "An Algorithmic Description of XCS" published by Martin Butz and Stewart Wilson (2002).
+Columnar storage of the parameters of the rules in the population. While a rule is in the population its parameters live in typed arrays, one
+per parameter, at the slot of the rule, and the Classifier object becomes a view on that slot. Population-wide sums are then taken as array
+operations over the occupied slots, which follow the population order.
+---------------------------------------------------------------------------------------------------------------------------------------------------------
+"""
+
+#Import Required Modules---------------
+from array import array
+from xcs_classifier import Classifier
+from xcs_constants import *
+try:
+    import numpy as np
+except ImportError:
+    np = None
+#--------------------------------------
+
+def buildParameterStore():
+    """ Returns the ParameterStore for a new ClassifierSet, or None when the parameters stay on the rule objects (cons.parameter_storage). """
+    if cons.parameter_storage == 'arrays':
+        if np != None:
+            return ParameterStore()
+        print("ParameterStore: Warning - array parameter storage requires NumPy, parameters are kept on the rule objects instead.")
+    elif cons.parameter_storage != 'objects':
+        print("ParameterStore: Warning - unknown parameter storage '"+str(cons.parameter_storage)+"', parameters are kept on the rule objects.")
+    return None
+
+
+FLOAT_PARAMETERS = ( 'prediction', 'error', 'fitness', 'accuracy', 'avg_actionset_size', 'delete_vote' )
+INT_PARAMETERS = ( 'numerosity', 'ga_timestamp', 'init_timestamp', 'action_cnt' )
+
+
+def storedParameter(name):
+    """ Returns a property reading and writing the named parameter at the slot of the rule. """
+    def getParameter(self):
+        return self.store.columns[name][self.slot]
+    def setParameter(self, value):
+        self.store.columns[name][self.slot] = value
+    return property( getParameter, setParameter )
+
+
+class ClassifierView( Classifier ):
+    """ A Classifier whose parameters are held by a ParameterStore. Rules become views when they enter the population and plain classifiers again when they leave it. """
+    prediction = storedParameter( 'prediction' )
+    error = storedParameter( 'error' )
+    fitness = storedParameter( 'fitness' )
+    accuracy = storedParameter( 'accuracy' )
+    avg_actionset_size = storedParameter( 'avg_actionset_size' )
+    delete_vote = storedParameter( 'delete_vote' )
+    numerosity = storedParameter( 'numerosity' )
+    ga_timestamp = storedParameter( 'ga_timestamp' )
+    init_timestamp = storedParameter( 'init_timestamp' )
+    action_cnt = storedParameter( 'action_cnt' )
+
+
+class ParameterStore:
+    def __init__(self):
+        """ Keeps the parameters of the rules in the population in typed arrays indexed by rule slot. Slots are handed out in insertion order and
+        compacted (keeping that order) when they run out, so the occupied slots always follow the population order. """
+        self.reset( 64 )
+
+    def reset(self, capacity):
+        """ Empties the store and makes room for capacity slots. """
+        self.capacity = capacity
+        self.columns = {}
+        for name in FLOAT_PARAMETERS:
+            self.columns[name] = array( 'd', bytes( 8 * capacity ) )
+        for name in INT_PARAMETERS:
+            self.columns[name] = array( 'q', bytes( 8 * capacity ) )
+        self.specificity = array( 'q', bytes( 8 * capacity ) )     # Number of specified attributes of the rule in each slot
+        self.active = array( 'b', bytes( capacity ) )              # 1 for the slots holding a rule
+        self.rules = [None] * capacity
+        self.top = 0                                               # Number of slots used so far, removed rules leave their slot empty
+
+    def attach(self, cl):
+        """ Moves the parameters of a rule entering the population into the next slot and turns the rule into a view on it. """
+        if self.top == self.capacity:
+            self.compact()
+        slot = self.top
+        self.top += 1
+        for name in FLOAT_PARAMETERS + INT_PARAMETERS:
+            self.columns[name][slot] = cl.__dict__.pop( name )
+        cl.__class__ = ClassifierView
+        cl.store = self
+        cl.slot = slot
+        self.specificity[slot] = len( cl.specified_attributes )
+        self.active[slot] = 1
+        self.rules[slot] = cl
+
+    def detach(self, cl):
+        """ Gives a rule leaving the population its parameters back and frees its slot. """
+        slot = cl.slot
+        values = {}
+        for name in FLOAT_PARAMETERS + INT_PARAMETERS:
+            values[name] = self.columns[name][slot]
+        cl.__class__ = Classifier
+        del cl.store
+        del cl.slot
+        cl.__dict__.update( values )
+        self.active[slot] = 0
+        self.rules[slot] = None
+
+    def compact(self):
+        """ Moves the rules to the first slots, in population order, with room for as many rules again. """
+        old_columns = self.columns
+        old_specificity = self.specificity
+        slots = [ slot for slot in range( self.top ) if self.active[slot] ]
+        rules = [ self.rules[slot] for slot in slots ]
+        capacity = 64
+        while capacity < 2 * len(slots):
+            capacity *= 2
+        self.reset( capacity )
+        for new_slot in range( len(slots) ):
+            for name in FLOAT_PARAMETERS + INT_PARAMETERS:
+                self.columns[name][new_slot] = old_columns[name][ slots[new_slot] ]
+            self.specificity[new_slot] = old_specificity[ slots[new_slot] ]
+            self.active[new_slot] = 1
+            self.rules[new_slot] = rules[new_slot]
+            rules[new_slot].slot = new_slot
+        self.top = len(slots)
+
+    #--------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+    # ARRAY OPERATIONS - sums are cumulative, left to right, so that they are bit-identical to the loops over the rule objects
+    #--------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+    def column(self, name):
+        """ Returns a NumPy view of the named parameter over the slots used so far. """
+        if name == 'specificity':
+            values = self.specificity
+        elif name == 'active':
+            return np.frombuffer( self.active, dtype=np.int8 )[ :self.top ]
+        else:
+            values = self.columns[name]
+        if values.typecode == 'd':
+            return np.frombuffer( values, dtype=np.float64 )[ :self.top ]
+        return np.frombuffer( values, dtype=np.int64 )[ :self.top ]
+
+    def activeSlots(self):
+        """ Returns the slots holding a rule, in population order. """
+        return np.flatnonzero( self.column( 'active' ) )
+
+    def updateActionSet(self, slots, reward):
+        """ Applies Classifier.updateActionExp, updateActionSetSize, updateXCSParameters and updateFitness to the rules in slots (the action set, in
+        order) at once, with the same floating point operations. The accuracy power is taken per rule with Python's pow: NumPy's vectorised power is
+        not correctly rounded on every platform. """
+        numerosity = self.column('numerosity')[slots]
+        action_set_numer = int( numerosity.sum() )
+        action_cnt = self.column('action_cnt')[slots] + 1
+        self.column('action_cnt')[slots] = action_cnt
+        averaging = action_cnt >= 1.0 / cons.beta     # Widrow-Hoff updates for experienced rules, running averages (MAM) before
+        #Action set size estimate----------------------------------------------
+        actionset_size = self.column('avg_actionset_size')[slots]
+        self.column('avg_actionset_size')[slots] = np.where( averaging, actionset_size + cons.beta * ( action_set_numer - actionset_size ),
+                                                             ( actionset_size * ( action_cnt - 1 ) + action_set_numer ) / action_cnt.astype( np.float64 ) )
+        #Prediction and prediction error---------------------------------------
+        prediction = self.column('prediction')[slots]
+        error = self.column('error')[slots]
+        deviation = np.abs( reward - prediction )
+        error = np.where( averaging, error + cons.beta * ( deviation - error ), ( error * ( action_cnt - 1 ) + deviation ) / action_cnt )
+        self.column('prediction')[slots] = np.where( averaging, prediction + cons.beta * ( reward - prediction ), ( prediction * ( action_cnt - 1 ) + reward ) / action_cnt )
+        self.column('error')[slots] = error
+        #Accuracy and fitness--------------------------------------------------
+        accuracy = np.ones( len(slots) )
+        for i in np.flatnonzero( error > cons.offset_epsilon ):
+            accuracy[i] = cons.alpha * ( ( float( error[i] )/cons.offset_epsilon ) ** (-cons.nu) )
+        self.column('accuracy')[slots] = accuracy
+        weighted_accuracy = accuracy * numerosity
+        accuracy_sum = self.sequentialSum( weighted_accuracy )
+        fitness = self.column('fitness')[slots]
+        self.column('fitness')[slots] = fitness + cons.beta * ( weighted_accuracy / accuracy_sum - fitness )
+
+    def sequentialSum(self, values):
+        """ Returns the left to right float sum of values, as a loop starting from 0.0 would compute it. """
+        if len(values) == 0:
+            return 0.0
+        return float( np.cumsum( values, dtype=np.float64 )[-1] )
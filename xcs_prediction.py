@@ -14,29 +14,35 @@ XCS: Michigan-style Learning Classifier System - A LCS for Reinforcement Learnin
 #import crandom as random
 import random
 from xcs_constants import *
+try:
+    import numpy as np
+except ImportError:
+    np = None
 #-------------------------------------
 
 class Prediction:
-    def __init__(self, population):
-        """ Constructs the voting array and determines the prediction decision. """
+    def __init__(self, population=None):
+        """ Constructs the voting array and determines the prediction decision. The arrays are sparse: they only hold the actions advocated by
+        the match set, every other action has a prediction of 0.0 and no numerosity. Without a population the arrays are left to be filled by BatchPrediction. """
         self.decision = None
         self.prediction = {}
-        denominator = {}
         self.tiebreak_numerosity = {}
 
-        for action in cons.env.format_data.action_list:
-            self.prediction[ action ] = 0.0
-            denominator[ action ] = 0.0
-            self.tiebreak_numerosity[ action ] = 0
-
-        for cl in population.match_set:
-            self.prediction[cl.action] += cl.prediction * cl.fitness
-            denominator[cl.action] += cl.fitness
-            self.tiebreak_numerosity[cl.action] += cl.numerosity
+        if population == None:
+            return
 
-        for action in cons.env.format_data.action_list:
-            if denominator[ action ] != 0:
-                self.prediction[ action ] /= denominator[ action ]
+        for action in population.match_actions:
+            prediction_sum = 0.0
+            fitness_sum = 0.0
+            numerosity_sum = 0
+            for cl in population.match_actions[action]:
+                prediction_sum += cl.prediction * cl.fitness
+                fitness_sum += cl.fitness
+                numerosity_sum += cl.numerosity
+            if fitness_sum != 0:
+                prediction_sum /= fitness_sum
+            self.prediction[ action ] = prediction_sum
+            self.tiebreak_numerosity[ action ] = numerosity_sum
 
 
     def getFitnessSum(self,population,low,high):
@@ -48,10 +54,11 @@ class Prediction:
         return fitness_sum
 
     def getPredictionArray(self):
-        return self.prediction
+        """ Returns the prediction of every action, including the actions not advocated by the match set. """
+        return dict( [ ( action, self.prediction.get( action, 0.0 ) ) for action in cons.env.format_data.action_list ] )
 
     def getPredictedPayoff(self):
-        return self.prediction[ self.decision ]
+        return self.prediction.get( self.decision, 0.0 )
 
     def decide1(self, exploring=True):
         """ Returns prediction decision. """
@@ -60,7 +67,7 @@ class Prediction:
         else:
             self.decision = cons.env.format_data.action_list[0]
             for action in cons.env.format_data.action_list:
-                if self.prediction[ action ] > self.prediction[ self.decision ]:
+                if self.prediction.get( action, 0.0 ) > self.prediction.get( self.decision, 0.0 ):
                     self.decision = action
         return self.decision
 
@@ -69,15 +76,7 @@ class Prediction:
         if exploring:
             self.decision = random.choice( cons.env.format_data.action_list )
         else:
-            max_prediction = 0.0
-            best_set = []  # Prediction is set up to handle best class ties for problems with more than 2 classes
-            for action in cons.env.format_data.action_list:
-                if self.prediction[action] >= max_prediction:
-                    max_prediction = self.prediction[action]
-
-            for action in cons.env.format_data.action_list:
-                if self.prediction[action] == max_prediction:  # Tie for best class
-                    best_set.append(action)
+            best_set = self.getBestSet()  # Prediction is set up to handle best class ties for problems with more than 2 classes
             if len( best_set ) == 1:
                 self.decision = best_set[0]
             else:
@@ -89,29 +88,100 @@ class Prediction:
         if exploring:
             self.decision = random.choice( cons.env.format_data.action_list )
         else:
-            max_prediction = 0.0
-            self.best_set = []  # Prediction is set up to handle best class ties for problems with more than 2 classes
-            for action in cons.env.format_data.action_list:
-                if self.prediction[action] >= max_prediction:
-                    max_prediction = self.prediction[action]
-
-            for action in cons.env.format_data.action_list:
-                if self.prediction[action] == max_prediction:  # Tie for best class
-                    self.best_set.append(action)
+            self.best_set = self.getBestSet()  # Prediction is set up to handle best class ties for problems with more than 2 classes
             if len( self.best_set ) == 1:
                 self.decision = self.best_set[0]
             else:
                 max_numerosity = 0
                 new_best_action = []
                 for action in self.best_set:
-                    if self.tiebreak_numerosity[action] >= max_numerosity:
-                        max_numerosity = self.tiebreak_numerosity[action]
+                    if self.tiebreak_numerosity.get( action, 0 ) >= max_numerosity:
+                        max_numerosity = self.tiebreak_numerosity.get( action, 0 )
                 for action in self.best_set:
-                    if self.tiebreak_numerosity[action] == max_numerosity:
+                    if self.tiebreak_numerosity.get( action, 0 ) == max_numerosity:
                         new_best_action.append(action)
                 # -----------------------------------------------------------------------
                 if len(new_best_action) == 1:
                     self.decision = new_best_action[0]
                 else:  # still a tie
                     self.decision = random.choice(new_best_action)
-        return self.decision
\ No newline at end of file
+        return self.decision
+
+    def getBestSet(self):
+        """ Returns the actions with the highest prediction (at least 0.0), in the order of the action list. Only the advocated actions are visited,
+        unless the best prediction is 0.0 and the actions without advocates tie for it. """
+        action_list = cons.env.format_data.action_list
+        max_prediction = 0.0
+        for action in self.prediction:
+            if self.prediction[action] >= max_prediction:
+                max_prediction = self.prediction[action]
+        if max_prediction == 0.0 and len( self.prediction ) < len( action_list ):
+            return [ action for action in action_list if self.prediction.get( action, 0.0 ) == 0.0 ]
+        best_set = [ action for action in self.prediction if self.prediction[action] == max_prediction ]
+        if len( best_set ) > 1:
+            best_set.sort( key=action_list.index )
+        return best_set
+
+
+class BatchPrediction:
+    def __init__(self, population):
+        """ Prepares the rule matrices of an unchanging population so that the prediction arrays of many instances are built at once
+        from their instance-by-rule match matrix. The rule columns are partitioned by action once, so each action only reduces the columns of
+        its own advocates. Sums are accumulated in population order with cumulative sums (adding the zeros of non-matching rules is exact), so
+        every array is bit-identical to the one Prediction builds from the match set. """
+        self.action_list = cons.env.format_data.action_list
+        numb_attributes = cons.env.format_data.numb_attributes
+        pop_set = list(population.pop_set)
+        self.conditions = np.full( ( len(pop_set), numb_attributes ), np.nan )   # Condition values, NaN where the attribute is not specified
+        for row in range( len(pop_set) ):
+            cl = pop_set[row]
+            for i in range( len(cl.condition) ):
+                self.conditions[ row, cl.specified_attributes[i] ] = float( cl.condition[i] )
+        self.general = np.isnan( self.conditions )
+        actions = [ cl.action for cl in pop_set ]
+        fitness = np.array( [ cl.fitness for cl in pop_set ], dtype=float )
+        prediction = np.array( [ cl.prediction for cl in pop_set ], dtype=float )
+        numerosity = np.array( [ cl.numerosity for cl in pop_set ], dtype=np.int64 )
+        self.columns = {}       # Rule columns advocating each action, in population order (actions without advocates are left out)
+        self.weighted = {}      # Fitness weighted prediction of the rules advocating each action
+        self.fitness = {}       # Fitness of the rules advocating each action
+        self.numerosity = {}    # Numerosity of the rules advocating each action
+        for action in self.action_list:
+            columns = np.flatnonzero( np.array( [ a == action for a in actions ], dtype=bool ) )
+            if len(columns) == 0:
+                continue
+            self.columns[action] = columns
+            self.weighted[action] = prediction[columns] * fitness[columns]
+            self.fitness[action] = fitness[columns]
+            self.numerosity[action] = numerosity[columns]
+        self.chunk_size = max( 1, 2**24 // max( 1, self.conditions.size ) )    # Instances per match matrix, bounds the memory of the comparison
+
+    def predict(self, states):
+        """ Returns one Prediction per state, with the arrays Prediction would have built from the match set of that state. """
+        predictions = []
+        for start in range( 0, len(states), self.chunk_size ):
+            chunk = states[ start:start + self.chunk_size ]
+            values = np.array( [ [ np.nan if value == cons.missing_label else value for value in state ] for state in chunk ], dtype=float )
+            agree = self.general[ np.newaxis, :, : ] | ( self.conditions[ np.newaxis, :, : ] == values[ :, np.newaxis, : ] )
+            agree |= np.isnan( values )[ :, np.newaxis, : ]
+            matched = agree.all( axis=2 )
+            chunk_predictions = [ Prediction() for _ in chunk ]
+            for action in self.columns:
+                advocates = matched[ :, self.columns[action] ]
+                numerator = self.sequentialSum( advocates, self.weighted[action] )
+                denominator = self.sequentialSum( advocates, self.fitness[action] )
+                numerosity = advocates.astype( np.int64 ) @ self.numerosity[action]
+                for j in np.flatnonzero( numerosity ):      # Only the actions advocated by the match set are stored
+                    if denominator[j] != 0:
+                        chunk_predictions[j].prediction[action] = float( numerator[j] ) / float( denominator[j] )
+                    else:
+                        chunk_predictions[j].prediction[action] = float( numerator[j] )
+                    chunk_predictions[j].tiebreak_numerosity[action] = int( numerosity[j] )
+            predictions += chunk_predictions
+        return predictions
+
+    def sequentialSum(self, matched, values):
+        """ Sums values over the matching rules of each instance, left to right in population order. """
+        if matched.shape[1] == 0:
+            return np.zeros( matched.shape[0] )
+        return np.cumsum( np.where( matched, values, 0.0 ), axis=1 )[ :, -1 ]
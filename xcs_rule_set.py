@@ -0,0 +1,64 @@
+"""
+Name:        xcs_rule_set.py
+Authors:     Bao Trung
+Contact:     baotrung@ecs.vuw.ac.nz
+Created:     October, 2026
+Description:
+---------------------------------------------------------------------------------------------------------------------------------------------------------
+XCS: Michigan-style Learning Classifier System - A LCS for Reinforcement Learning.  This XCS follows the version descibed in "An Algorithmic Description of XCS" published by Martin Butz and Stewart Wilson (2002).
+Container used for the population, match set and action set of the ClassifierSet. Rules are kept in insertion order under a stable slot ID, so
+that a rule is found or removed in O(1) while the remaining rules keep their order (the order of the population decides seeded runs, so removed
+rules are not swapped with the last one).
+---------------------------------------------------------------------------------------------------------------------------------------------------------
+"""
+
+#Import Required Modules---------------
+from itertools import count, islice
+#--------------------------------------
+
+class RuleSet:
+    def __init__(self, rules=()):
+        """ Insertion-ordered collection of rules with O(1) append, membership test and removal. """
+        self.slots = dict( zip( rules, count() ) )    # Slot ID (insertion serial) of each rule, in insertion order
+        self.next_slot = len( self.slots )            # Slot ID given to the next rule appended
+
+    def append(self, cl):
+        """ Adds cl after the rules already in the set. """
+        self.slots[cl] = self.next_slot
+        self.next_slot += 1
+
+    def remove(self, cl):
+        """ Removes cl from the set, raises ValueError if it is not in the set. """
+        if self.slots.pop( cl, None ) == None:
+            raise ValueError( "RuleSet.remove(cl): cl not in set" )
+
+    def addedSince(self, slot):
+        """ Returns the rules in the set with a slot ID from slot on, in insertion order. Only the rules added since then are visited. """
+        added = []
+        for cl in reversed( self.slots ):
+            if self.slots[cl] < slot:
+                break
+            added.append( cl )
+        added.reverse()
+        return added
+
+    def __contains__(self, cl):
+        return cl in self.slots
+
+    def __getitem__(self, position):
+        """ Returns the rule at position in insertion order (so that random.choice can pick from the set), walking from the nearer end without
+        copying the set. """
+        size = len( self.slots )
+        if position < 0:
+            position += size
+        if not 0 <= position < size:
+            raise IndexError( "RuleSet index out of range" )
+        if position < size // 2:
+            return next( islice( self.slots, position, None ) )
+        return next( islice( reversed( self.slots ), size - 1 - position, None ) )
+
+    def __iter__(self):
+        return iter( self.slots )
+
+    def __len__(self):
+        return len( self.slots )
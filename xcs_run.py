@@ -14,6 +14,8 @@ XCS: Michigan-style Learning Classifier System - A LCS for Reinforcement Learnin
 #import crandom as random
 import random
 import datetime
+import sys
+from multiprocessing import Pipe, get_all_start_methods, get_context
 from xcs_timer import Timer
 from xcs_config_parser import ConfigParser
 from xcs_offline_environment import Offline_Environment
@@ -55,6 +57,31 @@ def getOptions( argv ):
     if 'GASub' in opts:
         cons.do_ga_subsumption = bool(int( opts['GASub'] ))
 
+#Functions to run the cross validation folds----------------
+def runFold( fold_id ):
+    """ Runs XCS on the currently selected fold and returns the number of correctly classified testing instances. """
+    accuracy = XCS( str( fold_id ) ).run()[0]
+    return accuracy * env.format_data.numb_test_instances
+
+def runForkedFold( fold_id, conn ):
+    """ Runs one fold in a forked process, with a seed derived from the fold number, and sends its result back. """
+    if cons.use_seed:
+        random.seed( cons.random_seed + fold_id )
+    else:
+        random.seed()   # Otherwise every fold would continue the random sequence of the parent
+    conn.send( runFold( fold_id ) )
+    conn.close()
+
+def collectFold( running, accurate_numbs ):
+    """ Waits for the oldest running fold and stores its result, or None if the fold failed. """
+    fold_id, receiver, worker = running.pop( 0 )
+    try:
+        accurate_numbs[ fold_id ] = receiver.recv()
+    except EOFError:
+        accurate_numbs[ fold_id ] = None
+        print("XCS: Error - fold " + str( fold_id ) + " failed (exit code " + str( worker.exitcode ) + ").")
+    worker.join()
+
 helpstr = """Failed attempt to run e-LCS.  Please ensure that a configuration file giving all run parameters has been specified."""
 
 #Specify the name and file path for the configuration file.
@@ -86,11 +113,31 @@ if not cons.online_data_generator and cons.kfold_cv == True:
     total_instances = env.format_data.numb_train_instances
     env.format_data.splitFolds( cons.kfold )
     accurate_numbs = [0.0] * cons.kfold
-    for i in range( cons.kfold ):
-        env.format_data.selectTrainTestSets(i)
-        cons.parseIterations()  # Identify the maximum number of learning iterations as well as evaluation checkpoints.
-        accuracy = XCS(str(i)).run()[0]
-        accurate_numbs[i] = accuracy * env.format_data.numb_test_instances
+    if cons.parallel_folds > 0 and 'fork' in get_all_start_methods():
+        #Folds are selected here in order, as in a sequential run, and each forked process gets a copy-on-write snapshot of its fold data.
+        running = []
+        for i in range( cons.kfold ):
+            if len( running ) == cons.parallel_folds:
+                collectFold( running, accurate_numbs )
+            env.format_data.selectTrainTestSets(i)
+            cons.parseIterations()  # Identify the maximum number of learning iterations as well as evaluation checkpoints.
+            sys.stdout.flush()  # Pending output would otherwise be written again by the forked process
+            receiver, sender = Pipe( False )
+            worker = get_context( 'fork' ).Process( target=runForkedFold, args=( i, sender ) )
+            worker.start()
+            sender.close()
+            running.append( ( i, receiver, worker ) )
+        while running:
+            collectFold( running, accurate_numbs )
+    else:
+        for i in range( cons.kfold ):
+            env.format_data.selectTrainTestSets(i)
+            cons.parseIterations()  # Identify the maximum number of learning iterations as well as evaluation checkpoints.
+            accurate_numbs[i] = runFold( i )
+    failed_folds = [ i for i in range( cons.kfold ) if accurate_numbs[i] == None ]
+    if failed_folds:
+        print("XCS: Error - fold(s) " + str( failed_folds ) + " failed, no average accuracy for the " + str( cons.kfold ) + "-fold cross validation.")
+        sys.exit( 1 )
     print("AVERAGE ACCURACY After " + str( cons.kfold ) + "-FOLD CROSS VALIDATION is " + str( sum(accurate_numbs) / total_instances ))
 else:
     if not cons.online_data_generator: